@@ -1,19 +1,37 @@
 from django.contrib import admin
 
-from chat.models import ChatRoom, Message, MessageReceiver
+from chat.models import ChatRoom, Message, MessageReceiver, ReadCursor
 
 
 @admin.register(ChatRoom)
 class ChatRoomAdmin(admin.ModelAdmin):
-    list_display = ("id", "project", "status")
+    list_display = ("id", "project", "status", "message_count", "last_message_at")
     filter_horizontal = ("participants",)
 
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ("id", "chat_room", "sender", "timestamp")
+    # Rooms and senders are in the default database, they can not be joined to the messages.
+    list_select_related = ()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("chat_room", "sender")
 
 
 @admin.register(MessageReceiver)
 class MessageReceiverAdmin(admin.ModelAdmin):
     list_display = ("id", "message", "receiver", "is_seen")
+    list_select_related = ("message",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("receiver")
+
+
+@admin.register(ReadCursor)
+class ReadCursorAdmin(admin.ModelAdmin):
+    list_display = ("id", "chat_room", "user", "last_read_id", "modified_date")
+    list_select_related = ()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("chat_room", "user")
@@ -5,4 +5,6 @@ from django.utils.translation import gettext_lazy as _
 class ChatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat"
-    verbose_name = _("Chat Application")
\ No newline at end of file
+    verbose_name = _("Chat Application")
+    def ready(self):
+        import chat.signals
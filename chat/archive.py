@@ -0,0 +1,286 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from collections import deque
+from datetime import timedelta
+from itertools import islice, takewhile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from chat.models import ChatRoom, Message
+from user.models import User
+
+ARCHIVE_VERSION = 1
+ARCHIVED_COUNT_KEY = "chat_archive:count:%s:%s"
+ARCHIVED_COUNT_TIMEOUT = 24 * 60 * 60
+
+
+def archive_directory(chat_room):
+    return os.path.join(settings.CHAT_ARCHIVE_ROOT, chat_room.slug[:2])
+
+
+def manifest_path(chat_room):
+    return os.path.join(archive_directory(chat_room), f"{chat_room.slug}.json")
+
+
+def read_manifest(chat_room):
+    with open(manifest_path(chat_room)) as f:
+        return json.load(f)
+
+
+def temporary_file(path, mode):
+    # Unique per writer, two processes archiving the same room never write to the same file.
+    return tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path), prefix=os.path.basename(path) + ".",
+                                       suffix=".tmp", delete=False)
+
+
+def rooms_to_archive(older_than=None):
+    """Closed rooms untouched for CHAT_ARCHIVE_AFTER_DAYS, and archived rooms that got new messages since."""
+    older_than = older_than or timezone.now() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+    return ChatRoom.objects.filter(status="closed", modified_date__lt=older_than, message_count__gt=0).filter(
+        Q(archived_at__isnull=True) | Q(last_message_at__gt=F("archived_at"))
+    )
+
+
+def archive_room(chat_room, batch_size=1000):
+    """
+    Moves the messages of chat_room to <CHAT_ARCHIVE_ROOT>/<aa>/<slug>.<version>.jsonl.gz, one JSON object per
+    message in sequence order, described by the <slug>.json manifest next to it.
+
+    Every archive is written under a new name and only used once the manifest naming it replaces the previous one,
+    that rename is the single commit point: readers see either the old manifest and archive or the new ones. The
+    hot rows (and their MessageReceiver rows) are then deleted in batches of batch_size. A room archived before is
+    rewritten with its previous archive followed by its new messages, the previous archive is removed. Returns the
+    number of messages moved out of the hot tables, ChatRoom.message_count is recomputed to the messages left there.
+    """
+    directory = archive_directory(chat_room)
+    os.makedirs(directory, exist_ok=True)
+    previous = ArchiveReader(chat_room) if chat_room.archived_at else None
+
+    messages = Message.objects.filter(chat_room=chat_room).prefetch_related("sender").order_by("sequence")
+    digest = hashlib.sha256()
+    count = 0
+    archived_ids = []
+    first = last = None
+    # Unused until the manifest names it, the name is unique so a concurrent writer never overwrites it.
+    archive_file = tempfile.NamedTemporaryFile("wb", dir=directory, prefix=chat_room.slug + ".", suffix=".jsonl.gz",
+                                               delete=False)
+    manifest_file = temporary_file(manifest_path(chat_room), "w")
+    committed = False
+    try:
+        with archive_file as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+                if previous:
+                    for line in previous.lines():
+                        archive.write(line)
+                    count = previous.manifest["messages"]
+                    first = (previous.manifest["first_sequence"], previous.manifest["first_timestamp"])
+                    last = (previous.manifest["last_sequence"], previous.manifest["last_timestamp"])
+
+                for message in messages.iterator(chunk_size=batch_size):
+                    record = serialize_message(message)
+                    archive.write(json.dumps(record).encode() + b"\n")
+                    archived_ids.append(message.id)
+                    count += 1
+                    first = first or (record["sequence"], record["timestamp"])
+                    last = (record["sequence"], record["timestamp"])
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        with open(archive_file.name, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+        manifest = {
+            "version": ARCHIVE_VERSION,
+            "chat_room": chat_room.slug,
+            "archive": os.path.basename(archive_file.name),
+            "messages": count,
+            "first_sequence": first[0] if first else None,
+            "first_timestamp": first[1] if first else None,
+            "last_sequence": last[0] if last else None,
+            "last_timestamp": last[1] if last else None,
+            "sha256": digest.hexdigest(),
+            "created": timezone.now().isoformat(),
+        }
+        with manifest_file as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_file.name, manifest_path(chat_room))
+        committed = True
+    finally:
+        if os.path.exists(manifest_file.name):
+            os.unlink(manifest_file.name)
+        if not committed:
+            os.unlink(archive_file.name)
+
+    if previous:
+        try:
+            os.unlink(previous.path)
+        except FileNotFoundError:
+            # Removed by another process archiving the room at the same time.
+            pass
+
+    ChatRoom.objects.filter(pk=chat_room.pk).update(archived_at=timezone.now(),
+                                                    archived_sequence=manifest["last_sequence"] or 0)
+    for start in range(0, len(archived_ids), batch_size):
+        with transaction.atomic(using=router.db_for_write(Message)):
+            Message.objects.filter(id__in=archived_ids[start:start + batch_size]).delete()
+    # Messages sent while the room was being archived stay in the hot table and in the count.
+    ChatRoom.objects.filter(pk=chat_room.pk).update(
+        message_count=Message.objects.filter(chat_room=chat_room).count())
+    return len(archived_ids)
+
+
+def serialize_message(message):
+    return {
+        "id": message.id,
+        "sequence": message.sequence,
+        "sender_id": message.sender_id,
+        "sender": message.sender.username if message.sender else None,
+        "content": message.content,
+        "file": message.file.name or None,
+        "thumbnails": message.thumbnails,
+        "timestamp": message.timestamp.isoformat(),
+    }
+
+
+class ArchiveReader:
+    """
+    Streams the archived messages of a room, oldest first, without loading the archive in memory. Reads the archive
+    named by the manifest of the room when the reader is created.
+    """
+
+    def __init__(self, chat_room):
+        self.chat_room = chat_room
+        self.manifest = read_manifest(chat_room)
+        self.path = os.path.join(archive_directory(chat_room), self.manifest["archive"])
+
+    def lines(self):
+        with gzip.open(self.path, "rb") as archive:
+            yield from archive
+
+    def records(self):
+        for line in self.lines():
+            yield json.loads(line)
+
+    def messages(self, records):
+        """Unsaved Message instances for records, with their senders fetched in one query."""
+        senders = User.objects.in_bulk({record["sender_id"] for record in records if record["sender_id"]})
+        messages = []
+        for record in records:
+            message = Message(id=record["id"], chat_room=self.chat_room, sender=senders.get(record["sender_id"]),
+                              content=record["content"], file=record["file"], sequence=record["sequence"],
+                              thumbnails=record.get("thumbnails"))
+            message.timestamp = parse_datetime(record["timestamp"])
+            messages.append(message)
+        return messages
+
+
+class ArchivedMessageList:
+    """
+    Newest first list of the messages of an archived room, usable in place of a queryset by the paginators.
+
+    Messages still in the hot table (the room was reopened after being archived) come first, then the archive is
+    streamed up to the requested page. Only the project owner sees the messages sent before since, the number of
+    archived messages visible from since is cached under the checksum of the archive (which never changes).
+    """
+
+    def __init__(self, chat_room, hot_messages, since=None):
+        self.chat_room = chat_room
+        self.hot_messages = hot_messages.order_by("-sequence")
+        self.reader = ArchiveReader(chat_room)
+        self.since = since
+        self._hot_count = None
+        self._archived_count = None
+
+    def visible(self, record):
+        return self.since is None or parse_datetime(record["timestamp"]) >= self.since
+
+    @property
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot_messages.count()
+        return self._hot_count
+
+    @property
+    def archived_count(self):
+        if self._archived_count is None:
+            if self.since is None:
+                self._archived_count = self.reader.manifest["messages"]
+            else:
+                key = ARCHIVED_COUNT_KEY % (self.reader.manifest["sha256"], self.since.isoformat())
+                self._archived_count = cache.get(key)
+                if self._archived_count is None:
+                    self._archived_count = sum(1 for record in self.reader.records() if self.visible(record))
+                    cache.set(key, self._archived_count, ARCHIVED_COUNT_TIMEOUT)
+        return self._archived_count
+
+    def count(self):
+        return self.hot_count + self.archived_count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(self.count())
+        if start >= stop:
+            return []
+
+        messages = list(self.hot_messages[start:stop]) if start < self.hot_count else []
+        # Positions in the archive counted from its newest message.
+        start, stop = max(start - self.hot_count, 0), stop - self.hot_count
+        if stop > 0:
+            # The archive is oldest first: position p from the end is index archived_count - 1 - p.
+            first, last = self.archived_count - stop, self.archived_count - start
+            records = []
+            position = 0
+            for record in self.reader.records():
+                if not self.visible(record):
+                    continue
+                if position >= last:
+                    break
+                if position >= first:
+                    records.append(record)
+                position += 1
+            messages.extend(reversed(self.reader.messages(records)))
+        return messages
+
+    def paginate_sequence(self, paginator):
+        """
+        SequencePagination.paginate over the archive followed by the hot messages. The archive is only read when
+        the hot messages do not fill the page.
+        """
+        limit = paginator.limit + 1
+        # Rows archived but not deleted yet are only read from the archive.
+        last_archived = self.reader.manifest["last_sequence"] or 0
+        hot_messages = self.hot_messages.filter(sequence__gt=last_archived)
+        records = (record for record in self.reader.records() if self.visible(record))
+
+        if paginator.after is not None:
+            messages = []
+            if paginator.after < last_archived:
+                records = (record for record in records if record["sequence"] > paginator.after)
+                messages = self.reader.messages(list(islice(records, limit)))
+            if len(messages) < limit:
+                hot_messages = hot_messages.filter(sequence__gt=paginator.after).order_by("sequence")
+                messages += hot_messages[:limit - len(messages)]
+            return messages[:paginator.limit], len(messages) > paginator.limit
+
+        if paginator.before is not None:
+            hot_messages = hot_messages.filter(sequence__lt=paginator.before)
+        messages = list(hot_messages.order_by("-sequence")[:limit])
+        if len(messages) < limit:
+            if paginator.before is not None:
+                records = takewhile(lambda record: record["sequence"] < paginator.before, records)
+            messages += reversed(self.reader.messages(list(deque(records, maxlen=limit - len(messages)))))
+        has_more = len(messages) > paginator.limit
+        return messages[:paginator.limit][::-1], has_more
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from chat.archive import archive_room, rooms_to_archive
+from chat.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = "Moves the messages of old closed chat rooms to compressed archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+                            help="Archive closed rooms untouched for this many days")
+        parser.add_argument("--room", help="Slug of a single closed room to archive")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["room"]:
+            chat_rooms = ChatRoom.objects.filter(slug=options["room"])
+            if not chat_rooms.filter(status="closed").exists():
+                raise CommandError("Chat room not found or not closed.")
+        else:
+            chat_rooms = rooms_to_archive(timezone.now() - timedelta(days=options["days"]))
+
+        for chat_room in chat_rooms:
+            archived = archive_room(chat_room, batch_size=options["batch_size"])
+            self.stdout.write(f"Archived {archived} messages of {chat_room.slug}")
+
+        self.stdout.write(self.style.SUCCESS("Chat rooms archived successfully"))
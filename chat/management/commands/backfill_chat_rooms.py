@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max
+
+from chat.models import ChatRoom, Message
+
+
+class Command(BaseCommand):
+    help = "Recomputes the last message metadata and message count of chat rooms from their messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        room_ids = list(ChatRoom.objects.order_by("id").values_list("id", flat=True))
+
+        for start in range(0, len(room_ids), batch_size):
+            batch = room_ids[start:start + batch_size]
+            # Messages are in the chat database (see chat.routers), the rooms are aggregated there and updated
+            # with a bulk_update instead of subqueries.
+            stats = {
+                row["chat_room"]: row for row in
+                Message.objects.filter(chat_room__in=batch).order_by()
+                .values("chat_room").annotate(count=Count("id"), last=Max("sequence"))
+            }
+            # One (chat_room, sequence) condition per room would exceed the expression depth of SQLite, the rooms'
+            # messages at any of their last sequences are fetched and the last of each room is picked here.
+            last_messages = {
+                message.chat_room_id: message for message in Message.objects.filter(
+                    chat_room__in=list(stats), sequence__in={row["last"] for row in stats.values()})
+                if message.sequence == stats[message.chat_room_id]["last"]
+            }
+
+            chat_rooms = list(ChatRoom.objects.filter(id__in=batch))
+            for chat_room in chat_rooms:
+                last_message = last_messages.get(chat_room.pk)
+                if last_message is None:
+                    chat_room.last_message_at, chat_room.last_message_preview = chat_room.created, ""
+                    chat_room.last_sender_id, chat_room.message_count = None, 0
+                    continue
+                preview = last_message.content or last_message.file.name or ""
+                chat_room.last_message_at = last_message.timestamp
+                chat_room.last_message_preview = preview[:200]
+                chat_room.last_sender_id = last_message.sender_id
+                chat_room.message_count = stats[chat_room.pk]["count"]
+            ChatRoom.objects.bulk_update(chat_rooms, ["last_message_at", "last_message_preview", "last_sender",
+                                                      "message_count"])
+            self.stdout.write(f"Updated {start + len(chat_rooms)}/{len(room_ids)} chat rooms")
+
+        self.stdout.write(self.style.SUCCESS("Chat rooms backfilled successfully"))
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import random
+import os
+import resource
+import tempfile
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.models import ChatRoom
+from djangofls import routing
+from djangofls.jwt_middleware import JWTAuthMiddlewareStack
+from payment.models import Point, TransactionLog
+from user.models import User
+
+UNLIMITED = (1_000_000, 1_000_000)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class LedgerWriter(threading.Thread):
+    """Times small point transactions on the default database from its own thread while the chat is busy."""
+
+    def __init__(self, user, interval):
+        super().__init__(daemon=True)
+        self.user = user
+        self.interval = interval
+        self.latencies = []
+        self.errors = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                start = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        Point.objects.filter(user=self.user).update(balance=F("balance") + 1)
+                        TransactionLog.objects.create(user=self.user, username=self.user.username, amount=1,
+                                                      transaction_type="POINTS_RECEIVED", description="Benchmark")
+                except Exception:
+                    self.errors += 1
+                    continue
+                self.latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = ("Simulates chat rooms through JWTAuthMiddlewareStack and ChatConsumer in a throwaway test database and "
+            "reports delivery latency, throughput, database queries per message, peak memory and the latency of "
+            "point transactions written to the default database meanwhile")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=10)
+        parser.add_argument("--participants", type=int, default=2, help="Connected participants per room")
+        parser.add_argument("--messages", type=int, default=50, help="Messages sent in each room")
+        parser.add_argument("--rate", type=float, default=0, help="Messages per second per room, 0 for no pacing")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for the deliveries")
+        parser.add_argument("--keep-rate-limits", action="store_true",
+                            help="Apply CHAT_CONNECTION_RATE_LIMITS instead of disabling them")
+        parser.add_argument("--write-buffer", action="store_true",
+                            help="Save the messages through the group commit buffer (CHAT_WRITE_BUFFER)")
+        parser.add_argument("--ledger-interval", type=float, default=0.01,
+                            help="Seconds between the point transactions timed on the default database, 0 to disable")
+
+    def handle(self, *args, **options):
+        overrides = {"CHAT_WRITE_BUFFER": options["write_buffer"]}
+        if not options["keep_rate_limits"]:
+            limits = {kind: UNLIMITED for kind in ["message", "typing", "read", "sync"]}
+            overrides.update(CHAT_CONNECTION_RATE_LIMITS=limits, CHAT_USER_RATE_LIMITS=limits)
+
+        # File databases instead of the shared in-memory ones of the test runner, so that writers wait for the
+        # SQLite locks the way they do in production.
+        test_dir = tempfile.mkdtemp()
+        for alias in connections:
+            if connections[alias].vendor == "sqlite":
+                connections[alias].settings_dict["TEST"]["NAME"] = os.path.join(test_dir, f"{alias}.sqlite3")
+
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(**overrides):
+                report = self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        for label, value in report:
+            self.stdout.write(f"{label:>24}: {value}")
+
+    def run(self, options):
+        rooms = self.create_rooms(options["rooms"], options["participants"])
+        ledger = None
+        if options["ledger_interval"]:
+            user = User.objects.get(username="bench0")
+            Point.objects.get_or_create(user=user)
+            ledger = LedgerWriter(user, options["ledger_interval"])
+        report = asyncio.run(self.simulate(rooms, options, ledger))
+        if ledger is not None:
+            report += [
+                ("ledger writes", f"{len(ledger.latencies)} ({ledger.errors} failed)"),
+                ("ledger latency p50", f"{percentile(ledger.latencies, 50) * 1000:.1f} ms"),
+                ("ledger latency p99", f"{percentile(ledger.latencies, 99) * 1000:.1f} ms"),
+                ("ledger latency max", f"{max(ledger.latencies, default=0) * 1000:.1f} ms"),
+            ]
+        return report
+
+    @staticmethod
+    def create_rooms(room_count, participant_count):
+        password = make_password("benchmark")
+        users = User.objects.bulk_create([
+            User(username=f"bench{i}", slug=f"bench{i}", email=f"bench{i}@example.com", first_name="Bench",
+                 last_name="User", password=password, is_active=True)
+            for i in range(room_count * participant_count)
+        ])
+        rooms = []
+        for r in range(room_count):
+            chat_room = ChatRoom.objects.create()
+            participants = users[r * participant_count:(r + 1) * participant_count]
+            chat_room.participants.add(*participants)
+            rooms.append((chat_room.slug, [str(AccessToken.for_user(user)) for user in participants]))
+        return rooms
+
+    async def simulate(self, rooms, options, ledger=None):
+        application = JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+        counter = QueryCounter()
+        # Consumers reach the database from the thread used by database_sync_to_async, count queries there.
+        await database_sync_to_async(lambda: [connections[alias].execute_wrappers.append(counter)
+                                              for alias in connections])()
+
+        start = time.perf_counter()
+        sockets = []
+        for slug, tokens in rooms:
+            room_sockets = []
+            for token in tokens:
+                communicator = WebsocketCommunicator(application, f"/ws/{slug}/?token={token}")
+                connected, _ = await communicator.connect()
+                if not connected:
+                    raise RuntimeError(f"Could not connect to {slug}.")
+                room_sockets.append(communicator)
+            sockets.append(room_sockets)
+        connect_time = time.perf_counter() - start
+        connect_queries = counter.count
+
+        latencies = []
+        expected = options["messages"]
+        deadline = time.perf_counter() + options["timeout"]
+
+        async def read(communicator):
+            received = 0
+            while received < expected and time.perf_counter() < deadline:
+                try:
+                    frame = json.loads(await communicator.receive_from(timeout=deadline - time.perf_counter()))
+                except asyncio.TimeoutError:
+                    break
+                if frame.get("type") == "chat_message":
+                    latencies.append(time.perf_counter() - float(frame["content"]))
+                    received += 1
+
+        async def write(room_sockets):
+            interval = 1 / options["rate"] if options["rate"] else 0
+            for _ in range(expected):
+                sender = random.choice(room_sockets)
+                await sender.send_to(text_data=json.dumps({"type": "message", "content": repr(time.perf_counter())}))
+                await asyncio.sleep(interval)
+
+        if ledger is not None:
+            ledger.start()
+        start = time.perf_counter()
+        readers = [asyncio.create_task(read(communicator)) for room_sockets in sockets for communicator in room_sockets]
+        # A consumer that failed (e.g. "database is locked") kills its socket, it is reported instead of aborting.
+        await asyncio.gather(*(write(room_sockets) for room_sockets in sockets), return_exceptions=True)
+        failed = sum(isinstance(result, Exception) for result in await asyncio.gather(*readers, return_exceptions=True))
+        elapsed = time.perf_counter() - start
+        if ledger is not None:
+            ledger.stopped.set()
+            ledger.join()
+        message_queries = counter.count - connect_queries
+
+        await asyncio.gather(*(communicator.disconnect() for room_sockets in sockets for communicator in room_sockets),
+                             return_exceptions=True)
+
+        messages = len(rooms) * expected
+        deliveries = messages * options["participants"]
+        return [
+            ("connections", f"{len(rooms) * options['participants']} in {connect_time:.2f}s "
+                            f"({connect_queries} queries)"),
+            ("messages", f"{messages} in {elapsed:.2f}s ({messages / elapsed:.0f}/s)"),
+            ("deliveries", f"{len(latencies)}/{deliveries} ({len(latencies) / elapsed:.0f}/s)"),
+            ("failed sockets", failed),
+            ("latency p50", f"{percentile(latencies, 50) * 1000:.1f} ms"),
+            ("latency p95", f"{percentile(latencies, 95) * 1000:.1f} ms"),
+            ("latency p99", f"{percentile(latencies, 99) * 1000:.1f} ms"),
+            ("queries per message", f"{message_queries / messages:.1f}"),
+            ("peak RSS", f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB"),
+        ]
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from chat.models import Message, MessageReceiver, ReadCursor
+
+
+def legacy_columns(model):
+    """
+    Columns of the model's table in the default database, empty if it has none. The chat migrations stopped being
+    applied there with CHAT_DATABASE (see chat.routers), the tables keep the shape they had at that time.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return set()
+        return {column.name for column in connection.introspection.get_table_description(cursor, table)}
+
+
+def numbered(messages, chunk_size):
+    """
+    The message rows with their per-room sequence, numbered like chat.migrations.0022_message_sequence. The whole
+    table is numbered in SQL, filtering out the rows copied before would restart the numbering.
+    """
+    messages = messages.annotate(number=Window(RowNumber(), partition_by=[F("chat_room")],
+                                               order_by=[F("timestamp").asc(), F("id").asc()]))
+    for message in messages.iterator(chunk_size=chunk_size):
+        message["sequence"] = message.pop("number")
+        yield message
+
+
+class Command(BaseCommand):
+    help = ("Copies the messages, message receivers and read cursors stored in the default database before "
+            "CHAT_DATABASE was introduced to the chat database, keeping their ids. Run it before the chat database "
+            "receives new messages.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--delete", action="store_true", help="Delete the copied rows from the default database")
+
+    def handle(self, *args, **options):
+        target = settings.CHAT_DATABASE
+        if target == DEFAULT_DB_ALIAS:
+            raise CommandError("CHAT_DATABASE is the default database, there is nothing to move.")
+
+        self.batch_size = options["batch_size"]
+        columns = {model: legacy_columns(model) for model in [Message, MessageReceiver, ReadCursor]}
+        for model in [Message, MessageReceiver, ReadCursor]:
+            if not columns[model]:
+                self.stdout.write(f"No {model._meta.verbose_name_plural} in the default database")
+                continue
+            fields = [field.attname for field in model._meta.concrete_fields if field.column in columns[model]]
+            # Only the columns of the old table are selected, those added since are left to their defaults.
+            rows = model.objects.using(DEFAULT_DB_ALIAS).order_by("id").values(*fields)
+            if model is Message and "sequence" not in fields:
+                rows = numbered(rows, self.batch_size)
+            else:
+                rows = rows.iterator(chunk_size=self.batch_size)
+            self.stdout.write(f"Copied {self.copy(model, rows)} {model._meta.verbose_name_plural}")
+
+        if not columns[ReadCursor]:
+            self.stdout.write(f"Backfilled the read cursors of {self.backfill_read_cursors()} room members")
+        # The rooms were migrated without their messages, their last message and count are computed from the copies.
+        call_command("backfill_chat_rooms", batch_size=self.batch_size, stdout=self.stdout)
+
+        if options["delete"]:
+            connection = connections[DEFAULT_DB_ALIAS]
+            with transaction.atomic(using=DEFAULT_DB_ALIAS), connection.cursor() as cursor:
+                # Raw deletes, the ORM would select the current columns of the models to cascade.
+                for model in [ReadCursor, MessageReceiver, Message]:
+                    if columns[model]:
+                        cursor.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+            self.stdout.write("Deleted the copies from the default database")
+
+        self.stdout.write(self.style.SUCCESS("Chat tables moved successfully"))
+
+    def copy(self, model, rows):
+        target = settings.CHAT_DATABASE
+        last_id = model.objects.using(target).order_by("-id").values_list("id", flat=True).first() or 0
+        copied = 0
+        batch = []
+        for row in rows:
+            if row["id"] <= last_id:
+                continue
+            batch.append(model(**row))
+            if len(batch) == self.batch_size:
+                copied += self.save(model, batch)
+                batch = []
+        return copied + self.save(model, batch)
+
+    @staticmethod
+    def save(model, batch):
+        with transaction.atomic(using=settings.CHAT_DATABASE):
+            model.objects.using(settings.CHAT_DATABASE).bulk_create(batch)
+        return len(batch)
+
+    def backfill_read_cursors(self):
+        """Read cursors of the copied rooms from the last message each receiver saw, like chat.migrations.0021."""
+        target = settings.CHAT_DATABASE
+        seen = (MessageReceiver.objects.using(target)
+                .filter(is_seen=True, receiver__isnull=False)
+                .values("message__chat_room", "receiver")
+                .annotate(last_read_id=models.Max("message")))
+        read_cursors = [
+            ReadCursor(chat_room_id=row["message__chat_room"], user_id=row["receiver"],
+                       last_read_id=row["last_read_id"])
+            for row in seen.iterator()
+        ]
+        with transaction.atomic(using=target):
+            # Cursors moved since the switch to the chat database are kept.
+            ReadCursor.objects.using(target).bulk_create(read_cursors, batch_size=self.batch_size,
+                                                         ignore_conflicts=True)
+        return len(read_cursors)
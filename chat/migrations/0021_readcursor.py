@@ -0,0 +1,49 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations, models, router
+import django.db.models.deletion
+
+
+def backfill_read_cursors(apps, schema_editor):
+    MessageReceiver = apps.get_model("chat", "MessageReceiver")
+    ReadCursor = apps.get_model("chat", "ReadCursor")
+    db_alias = schema_editor.connection.alias
+    if not router.allow_migrate_model(db_alias, ReadCursor):
+        return
+
+    seen = (MessageReceiver.objects.using(db_alias)
+            .filter(is_seen=True, receiver__isnull=False)
+            .values("message__chat_room", "receiver")
+            .annotate(last_read_id=models.Max("message")))
+    ReadCursor.objects.using(db_alias).bulk_create([
+        ReadCursor(chat_room_id=row["message__chat_room"], user_id=row["receiver"], last_read_id=row["last_read_id"])
+        for row in seen.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0020_alter_message_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_id', models.BigIntegerField(default=0, verbose_name='Last Read Message')),
+                ('modified_date', models.DateTimeField(auto_now=True, verbose_name='Modified Date')),
+                ('chat_room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Read Cursor',
+                'verbose_name_plural': 'Read Cursors',
+                'unique_together': {('chat_room', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_read_cursors, migrations.RunPython.noop),
+    ]
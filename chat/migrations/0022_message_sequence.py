@@ -0,0 +1,38 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:28
+
+from django.db import migrations, models, router
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def number_messages(apps, schema_editor):
+    Message = apps.get_model("chat", "Message")
+    db_alias = schema_editor.connection.alias
+    if not router.allow_migrate_model(db_alias, Message):
+        return
+
+    numbered = Message.objects.using(db_alias).annotate(
+        number=Window(RowNumber(), partition_by=[F("chat_room")], order_by=[F("timestamp").asc(), F("id").asc()])
+    ).values_list("id", "number")
+    messages = [Message(id=message_id, sequence=number) for message_id, number in numbered]
+    Message.objects.using(db_alias).bulk_update(messages, ["sequence"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0021_readcursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='sequence',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Sequence'),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('chat_room', 'sequence'), name='chat_message_room_sequence'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:32
+
+from django.conf import settings
+from django.db import migrations, models, router
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_last_messages(apps, schema_editor, batch_size=1000):
+    """
+    Last message metadata and message count of the existing rooms, like the backfill_chat_rooms command. The added
+    columns hold the time of the migration until then, rooms without messages take their creation time.
+    """
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    Message = apps.get_model("chat", "Message")
+    db_alias = schema_editor.connection.alias
+    if not router.allow_migrate_model(db_alias, ChatRoom):
+        return
+    # With a separate CHAT_DATABASE the messages are not in this database, move_chat_database backfills the rooms
+    # once it copied them there.
+    has_messages = router.allow_migrate_model(db_alias, Message)
+
+    room_ids = list(ChatRoom.objects.using(db_alias).order_by("id").values_list("id", flat=True))
+    for start in range(0, len(room_ids), batch_size):
+        batch = room_ids[start:start + batch_size]
+        stats, last_messages = {}, {}
+        if has_messages:
+            stats = {
+                row["chat_room"]: row for row in
+                Message.objects.using(db_alias).filter(chat_room__in=batch).order_by()
+                .values("chat_room").annotate(count=models.Count("id"), last_id=models.Max("id"))
+            }
+            last_messages = Message.objects.using(db_alias).in_bulk([row["last_id"] for row in stats.values()])
+
+        chat_rooms = list(ChatRoom.objects.using(db_alias).filter(id__in=batch))
+        for chat_room in chat_rooms:
+            row = stats.get(chat_room.pk)
+            if row is None:
+                chat_room.last_message_at = chat_room.created
+                continue
+            last_message = last_messages[row["last_id"]]
+            preview = last_message.content or last_message.file.name or ""
+            chat_room.last_message_at = last_message.timestamp
+            chat_room.last_message_preview = preview[:200]
+            chat_room.last_sender_id = last_message.sender_id
+            chat_room.message_count = row["count"]
+        ChatRoom.objects.using(db_alias).bulk_update(chat_rooms, ["last_message_at", "last_message_preview",
+                                                                  "last_sender", "message_count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0022_message_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Last Message At'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=200, verbose_name='Last Message Preview'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Last Sender'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Message Count'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['status', 'last_message_at'], name='chat_room_status_last_msg'),
+        ),
+        migrations.RunPython(backfill_last_messages, migrations.RunPython.noop),
+    ]
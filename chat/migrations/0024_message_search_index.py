@@ -0,0 +1,73 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:52
+
+from django.db import migrations, router
+
+SQLITE_CREATE = [
+    # External content table: the text lives in chat_message only, chat_room_id is indexed as a token so the
+    # room filter is part of the MATCH.
+    """
+    CREATE VIRTUAL TABLE chat_message_fts USING fts5(
+        content, chat_room_id, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, content, chat_room_id) VALUES (new.id, new.content, new.chat_room_id);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content, chat_room_id)
+        VALUES ('delete', old.id, old.content, old.chat_room_id);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF content, chat_room_id ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content, chat_room_id)
+        VALUES ('delete', old.id, old.content, old.chat_room_id);
+        INSERT INTO chat_message_fts(rowid, content, chat_room_id) VALUES (new.id, new.content, new.chat_room_id);
+    END
+    """,
+    "INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TABLE IF EXISTS chat_message_fts",
+]
+
+POSTGRES_CREATE = [
+    "CREATE INDEX chat_message_content_search ON chat_message "
+    "USING GIN (to_tsvector('simple'::regconfig, COALESCE(content, '')))",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS chat_message_content_search",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        Message = apps.get_model("chat", "Message")
+        connection = schema_editor.connection
+        if connection.vendor not in statements or not router.allow_migrate_model(connection.alias, Message):
+            return
+        for statement in statements[connection.vendor]:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0023_chatroom_last_message'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({"sqlite": SQLITE_CREATE, "postgresql": POSTGRES_CREATE}),
+            run_for_vendor({"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0024_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Archived At'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='archived_sequence',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Last Archived Sequence'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:54
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from djangofls.search import run_for_vendor
+
+search_index = import_module("chat.migrations.0024_message_search_index")
+
+# Altering the foreign keys remakes chat_message on SQLite, which drops the triggers keeping chat_message_fts in sync.
+restore_search_triggers = run_for_vendor("chat.Message", {"sqlite": search_index.SQLITE_CREATE[1:]})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0025_chatroom_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AlterField(
+            model_name='message',
+            name='chat_room',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='messages', to='chat.chatroom'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='sender',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='messagereceiver',
+            name='receiver',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='readcursor',
+            name='chat_room',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='read_cursors', to='chat.chatroom'),
+        ),
+        migrations.AlterField(
+            model_name='readcursor',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='chat_read_cursors', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
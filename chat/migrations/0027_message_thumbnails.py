@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0026_message_chat_database'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='thumbnails',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Thumbnails'),
+        ),
+    ]
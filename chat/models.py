@@ -1,8 +1,13 @@
+import operator
 import uuid
+from functools import reduce
 from urllib.parse import quote
 
-from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Value, F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from project.models import Project
@@ -22,25 +27,69 @@ class ChatRoom(models.Model):
     slug = models.SlugField(unique=True)
     modified_date = models.DateTimeField(auto_now=True, verbose_name=_("Modified Date"))
     created = models.DateTimeField(auto_now_add=True)
+    # Denormalized from the messages so the room list is ordered without aggregating them.
+    last_message_at = models.DateTimeField(default=timezone.now, verbose_name=_("Last Message At"))
+    last_message_preview = models.CharField(max_length=200, blank=True, verbose_name=_("Last Message Preview"))
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+",
+                                    verbose_name=_("Last Sender"))
+    # Messages in the hot table only, those moved to the archive are counted by its manifest (see chat.archive).
+    message_count = models.PositiveIntegerField(default=0, verbose_name=_("Message Count"))
+    # Set once the messages of a closed room were moved to its archive, see chat.archive.
+    archived_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Archived At"))
+    archived_sequence = models.PositiveBigIntegerField(default=0, verbose_name=_("Last Archived Sequence"))
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = str(uuid.uuid4())
         super(ChatRoom, self).save(*args, **kwargs)
 
+    @classmethod
+    def record_messages(cls, last_message, count=1):
+        preview = last_message.content or (last_message.file.name if last_message.file else "")
+        cls.objects.filter(pk=last_message.chat_room_id).update(
+            last_message_at=last_message.timestamp,
+            last_message_preview=preview[:200],
+            last_sender_id=last_message.sender_id,
+            message_count=F("message_count") + count,
+        )
+
     def __str__(self):
         if self.project:
             return str(_(f"Chat Room for {self.project.title}"))
         return str(_("Chat Room (No associated project)"))
 
+    def visible_since(self, user):
+        """Only the project owner sees the messages exchanged before a proposal was chosen."""
+        try:
+            chosen_proposal_time = self.project.chosenproposal.chosen_date
+            published_user_id = self.project.published_user_id
+        except (AttributeError, ObjectDoesNotExist):
+            return None
+
+        if chosen_proposal_time and user.pk != published_user_id:
+            return chosen_proposal_time
+        return None
+
+    def visible_messages(self, user):
+        messages = Message.objects.filter(chat_room=self)
+        since = self.visible_since(user)
+        if since is not None:
+            messages = messages.filter(timestamp__gte=since)
+        return messages
+
     class Meta:
         verbose_name = _("Chat Room")
         verbose_name_plural = _("Chat Rooms")
+        indexes = [
+            models.Index(fields=["status", "last_message_at"], name="chat_room_status_last_msg"),
+        ]
 
 
 class Message(models.Model):
-    chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name="messages")
-    sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Messages, receivers and read cursors are in the chat database (see chat.routers), their references to the
+    # default database have no database constraint and deletions are cascaded by chat.signals.
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.DO_NOTHING, db_constraint=False, related_name="messages")
+    sender = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True)
 
     def project_chat_file_path(self, filename):
         path = f"project_files/chat/{self.chat_room.slug}/{self.sender}/{filename}"
@@ -51,22 +100,63 @@ class Message(models.Model):
     content = models.TextField(null=True, blank=True, verbose_name="Message")
     file = models.FileField(upload_to=project_chat_file_path, null=True, blank=True, verbose_name=_("File"))
     timestamp = models.DateTimeField(auto_now_add=True, verbose_name=_("Timestamp"))
+    sequence = models.PositiveBigIntegerField(default=0, editable=False, verbose_name=_("Sequence"))
+    # WebP thumbnails of an image attachment by size name, made by chat.tasks.make_message_thumbnails.
+    thumbnails = models.JSONField(null=True, blank=True, editable=False, verbose_name=_("Thumbnails"))
 
     def __str__(self):
         return str(_(f"Message from {self.sender} in {self.chat_room}"))
 
+    def thumbnail_urls(self):
+        if not self.thumbnails:
+            return None
+        return {size: self.file.storage.url(name) for size, name in self.thumbnails.items()}
+
     def clean(self):
         if (self.sender not in self.chat_room.participants.all()) and not self.sender.is_admin:
             raise ValidationError(_("You are not a participant in this chat room."))
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        # The room metadata is in the default database: it is updated once the message is committed, so the chat
+        # transaction never waits on the default database and a rolled back message leaves the room untouched.
+        using = router.db_for_write(Message, instance=self)
+        if self.sequence:
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+                transaction.on_commit(lambda: ChatRoom.record_messages(self), using=using)
+            return
+
+        # The next sequence of the room is computed inside the INSERT itself, a concurrent insert that took the same
+        # number fails on the (chat_room, sequence) constraint and is retried. Numbering of a reopened archived room
+        # continues after its archived messages.
+        for attempt in range(3):
+            self.sequence = Coalesce(Subquery(
+                Message.objects.filter(chat_room_id=self.chat_room_id).order_by()
+                .values("chat_room").annotate(last=Max("sequence")).values("last")
+            ), Value(self.chat_room.archived_sequence)) + 1
+            try:
+                with transaction.atomic(using=using):
+                    super().save(*args, **kwargs)
+                    transaction.on_commit(lambda: ChatRoom.record_messages(self), using=using)
+                break
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+        self.sequence = Message.objects.filter(pk=self.pk).values_list("sequence", flat=True).get()
+
     class Meta:
         verbose_name = _("Message")
         verbose_name_plural = _("Messages")
+        constraints = [
+            models.UniqueConstraint(fields=["chat_room", "sequence"], name="chat_message_room_sequence"),
+        ]
 
 
 class MessageReceiver(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
-    receiver = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    receiver = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True)
     is_seen = models.BooleanField(default=False)
 
     def __str__(self):
@@ -75,3 +165,63 @@ class MessageReceiver(models.Model):
     class Meta:
         verbose_name = _("Message Receiver")
         verbose_name_plural = _("Message Receivers")
+
+
+class ReadCursor(models.Model):
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.DO_NOTHING, db_constraint=False,
+                                  related_name="read_cursors")
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False,
+                             related_name="chat_read_cursors")
+    last_read_id = models.BigIntegerField(default=0, verbose_name=_("Last Read Message"))
+    modified_date = models.DateTimeField(auto_now=True, verbose_name=_("Modified Date"))
+
+    def __str__(self):
+        return str(_(f"{self.user} read up to {self.last_read_id} in {self.chat_room}"))
+
+    class Meta:
+        unique_together = ["chat_room", "user"]
+        verbose_name = _("Read Cursor")
+        verbose_name_plural = _("Read Cursors")
+
+    @classmethod
+    def mark_read(cls, chat_room, user, message_id=None):
+        if message_id is None:
+            message_id = Message.objects.filter(chat_room=chat_room).aggregate(last=Max("id"))["last"] or 0
+        updated = cls.objects.filter(chat_room=chat_room, user=user, last_read_id__lt=message_id).update(
+            last_read_id=message_id, modified_date=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(chat_room=chat_room, user=user, defaults={"last_read_id": message_id})
+        return message_id
+
+    @classmethod
+    def room_cursors(cls, chat_room):
+        read_cursors = dict.fromkeys(chat_room.participants.values_list("id", flat=True), 0)
+        read_cursors.update(cls.objects.filter(chat_room=chat_room).values_list("user_id", "last_read_id"))
+        return read_cursors
+
+    @classmethod
+    def unread_count(cls, chat_room, user):
+        return cls.unread_counts([chat_room], user).get(chat_room.pk, 0)
+
+    @classmethod
+    def unread_counts(cls, chat_rooms, user):
+        """
+        Messages of others after the user's read cursor, for a page of rooms in one grouped query. Messages the user
+        can not see (see ChatRoom.visible_since) are not counted.
+        """
+        last_read_id = cls.objects.filter(chat_room=OuterRef("chat_room"), user=user).values("last_read_id")[:1]
+        messages = (Message.objects.filter(chat_room__in=[chat_room.pk for chat_room in chat_rooms])
+                    .exclude(sender=user)
+                    .filter(id__gt=Coalesce(Subquery(last_read_id), Value(0))))
+        rooms_since = {}
+        for chat_room in chat_rooms:
+            since = chat_room.visible_since(user)
+            if since is not None:
+                rooms_since.setdefault(since, []).append(chat_room.pk)
+        if rooms_since:
+            messages = messages.exclude(reduce(operator.or_, [
+                Q(chat_room__in=room_ids, timestamp__lt=since) for since, room_ids in rooms_since.items()
+            ]))
+        return dict(
+            messages.order_by().values("chat_room").annotate(unread=Count("id")).values_list("chat_room", "unread")
+        )
@@ -3,3 +3,46 @@ from rest_framework import pagination
 
 class ChatPagination(pagination.PageNumberPagination):
     page_size = 5
+
+
+class SequencePagination:
+    """
+    Messages after or before a sequence number of the room, oldest first.
+
+    Reconnecting clients pass the last sequence they have as ``after`` to fetch only what they missed, and the
+    oldest one they have as ``before`` to scroll back. One LIMIT query per page, nothing is counted.
+    """
+    default_limit = 50
+    max_limit = 200
+
+    def __init__(self, after=None, before=None, limit=None):
+        self.after = self.parse(after, "after")
+        self.before = self.parse(before, "before")
+        self.limit = min(self.parse(limit, "limit") or self.default_limit, self.max_limit)
+
+    @staticmethod
+    def parse(value, name):
+        if value is None or value == "":
+            return None
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be an integer.")
+        if value < 0:
+            raise ValueError(f"{name} must be positive.")
+        return value
+
+    def paginate(self, queryset):
+        if self.after is not None:
+            queryset = queryset.filter(sequence__gt=self.after).order_by("sequence")
+        else:
+            if self.before is not None:
+                queryset = queryset.filter(sequence__lt=self.before)
+            queryset = queryset.order_by("-sequence")
+
+        messages = list(queryset[:self.limit + 1])
+        has_more = len(messages) > self.limit
+        messages = messages[:self.limit]
+        if self.after is None:
+            messages.reverse()
+        return messages, has_more
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Models of the chat app written for every message, they live in settings.CHAT_DATABASE.
+CHAT_DATABASE_MODELS = {"message", "messagereceiver", "readcursor"}
+
+
+def is_chat_database_model(app_label, model_name):
+    return app_label == "chat" and model_name in CHAT_DATABASE_MODELS
+
+
+class ChatRouter:
+    """
+    Keeps the high-churn chat tables in settings.CHAT_DATABASE, so message bursts never hold the write lock of the
+    default database used by projects, payments and users. Everything else stays in the default database.
+
+    Foreign keys from the chat database to rooms and users are plain id columns without a database constraint,
+    deleting a room or a user is propagated by chat.signals. Queries can not join across the two databases: use
+    prefetch_related instead of select_related for the sender and the room of messages.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.CHAT_DATABASE == DEFAULT_DB_ALIAS:
+            return None
+        if is_chat_database_model(model._meta.app_label, model._meta.model_name):
+            return settings.CHAT_DATABASE
+        # Without an answer Django picks the database of the instance in the hints, a message's sender would be
+        # looked up in the chat database.
+        return DEFAULT_DB_ALIAS
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, settings.CHAT_DATABASE}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if settings.CHAT_DATABASE == DEFAULT_DB_ALIAS:
+            return None
+        if model_name is None:
+            # RunPython and RunSQL operations, those of the chat app check allow_migrate_model themselves.
+            return app_label == "chat" or db != settings.CHAT_DATABASE
+        return (db == settings.CHAT_DATABASE) == is_chat_database_model(app_label, model_name)
@@ -0,0 +1,129 @@
+import base64
+import json
+
+from django.db import connections, router
+from django.utils.html import escape
+
+from chat.models import Message
+from djangofls.search import fts5_match, search_terms
+
+# Highlighted terms are delimited with control characters by the database, the text is escaped before they are
+# turned into <mark> tags so message content can never inject markup.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+
+class SearchError(ValueError):
+    pass
+
+
+class SearchHit:
+    def __init__(self, message_id, rank, highlight):
+        self.message_id = message_id
+        self.rank = rank
+        self.highlight = highlight
+
+
+def encode_cursor(hit):
+    return base64.urlsafe_b64encode(json.dumps([hit.rank, hit.message_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(message_id)
+    except (ValueError, TypeError):
+        raise SearchError("Invalid cursor.")
+
+
+def render_highlight(text):
+    return escape(text).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
+
+
+class MessageSearchBackend:
+    """
+    Ranked full-text search over the messages of a room.
+
+    Results are ordered best match first (lower rank is better) and paginated with an opaque (rank, id) cursor, so
+    a page never counts or offsets over the matches before it.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def search(self, chat_room, query, since=None, cursor=None, limit=20):
+        """Returns up to limit SearchHit for messages of chat_room newer than since, and the cursor of the next page."""
+        terms = search_terms(query)
+        if not terms:
+            raise SearchError("Search query is empty.")
+        after = decode_cursor(cursor) if cursor else None
+
+        hits = self.query(chat_room, terms, since, after, limit + 1)
+        next_cursor = encode_cursor(hits[limit - 1]) if len(hits) > limit else None
+        return hits[:limit], next_cursor
+
+    def query(self, chat_room, terms, since, after, limit):
+        raise NotImplementedError
+
+
+class SQLiteMessageSearch(MessageSearchBackend):
+    """Uses the chat_message_fts FTS5 index, kept in sync with chat_message by triggers (see migration 0024)."""
+
+    def query(self, chat_room, terms, since, after, limit):
+        sql = [
+            "SELECT m.id, bm25(chat_message_fts) AS score,",
+            "snippet(chat_message_fts, 0, %s, %s, '…', 24)",
+            "FROM chat_message_fts JOIN chat_message m ON m.id = chat_message_fts.rowid",
+            "WHERE chat_message_fts MATCH %s",
+        ]
+        params = [HIGHLIGHT_START, HIGHLIGHT_END, f"chat_room_id:{chat_room.pk} AND content:({fts5_match(terms)})"]
+        if since is not None:
+            sql.append("AND m.timestamp >= %s")
+            params.append(self.connection.ops.adapt_datetimefield_value(since))
+        if after is not None:
+            sql.append("AND (bm25(chat_message_fts) > %s OR (bm25(chat_message_fts) = %s AND m.id > %s))")
+            params.extend([after[0], after[0], after[1]])
+        sql.append("ORDER BY score, m.id LIMIT %s")
+        params.append(limit)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(" ".join(sql), params)
+            return [SearchHit(message_id, rank, highlight) for message_id, rank, highlight in cursor.fetchall()]
+
+
+class PostgresMessageSearch(MessageSearchBackend):
+    """Uses the GIN index on the 'simple' tsvector of the content created by migration 0024."""
+
+    def query(self, chat_room, terms, since, after, limit):
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+        from django.db.models import F, Q
+
+        search_query = SearchQuery(" & ".join(terms[:-1] + [terms[-1] + ":*"]), config="simple", search_type="raw")
+        # ts_rank is higher for better matches, it is negated to share the ascending order of the SQLite backend.
+        vector = SearchVector("content", config="simple")
+        messages = Message.objects.using(self.connection.alias).annotate(
+            document=vector,
+            rank=-SearchRank(vector, search_query),
+            highlight=SearchHeadline("content", search_query, config="simple", start_sel=HIGHLIGHT_START,
+                                     stop_sel=HIGHLIGHT_END, max_words=24, min_words=8),
+        ).filter(chat_room_id=chat_room.pk, document=search_query)
+        if since is not None:
+            messages = messages.filter(timestamp__gte=since)
+        if after is not None:
+            messages = messages.filter(Q(rank__gt=after[0]) | Q(rank=after[0], id__gt=after[1]))
+        messages = messages.order_by(F("rank"), "id").values_list("id", "rank", "highlight")[:limit]
+        return [SearchHit(message_id, rank, highlight) for message_id, rank, highlight in messages]
+
+
+BACKENDS = {
+    "sqlite": SQLiteMessageSearch,
+    "postgresql": PostgresMessageSearch,
+}
+
+
+def get_search_backend():
+    connection = connections[router.db_for_read(Message)]
+    try:
+        return BACKENDS[connection.vendor](connection)
+    except KeyError:
+        raise SearchError(f"Message search is not supported on {connection.vendor}.")
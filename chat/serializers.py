@@ -1,10 +1,11 @@
 from django.utils.translation import gettext_lazy as _
+from django.db.models import Prefetch
 from drf_extra_fields.fields import Base64FileField
 import filetype
 
 from rest_framework import serializers
 
-from chat.models import ChatRoom, Message
+from chat.models import ChatRoom, Message, ReadCursor
 from user.models import User
 
 
@@ -64,21 +65,57 @@ class MessageSerializer(serializers.ModelSerializer):
     chat_room = serializers.StringRelatedField()
     sender = UserSerializer(read_only=True)
     file = FileField(required=False)
+    thumbnails = serializers.SerializerMethodField()
+    is_seen = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
         fields = "__all__"
 
+    def get_thumbnails(self, instance):
+        urls = instance.thumbnail_urls()
+        request = self.context.get("request")
+        if urls and request is not None:
+            urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+        return urls
+
+    def get_is_seen(self, instance):
+        # read_cursors maps every participant id to the last message id they have read.
+        read_cursors = self.context.get("read_cursors")
+        if not read_cursors:
+            return False
+        readers = [last_read_id for user_id, last_read_id in read_cursors.items() if user_id != instance.sender_id]
+        return bool(readers) and min(readers) >= instance.id
+
+
+class ChatRoomListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        chat_rooms = list(data.all() if hasattr(data, "all") else data)
+        request = self.context.get("request")
+        if request is not None and request.user.is_authenticated:
+            self.context["unread_counts"] = ReadCursor.unread_counts(chat_rooms, request.user)
+        return super().to_representation(chat_rooms)
+
 
 class ChatRoomSerializer(serializers.ModelSerializer):
     chats_url = serializers.HyperlinkedIdentityField(view_name="chat-message", lookup_field="slug")
     project_name = serializers.SerializerMethodField()
     status = serializers.StringRelatedField()
     participants_info = serializers.SerializerMethodField(read_only=True, label=_("Participants Information"))
+    unread_count = serializers.SerializerMethodField(label=_("Unread Messages"))
 
     class Meta:
         model = ChatRoom
         fields = "__all__"
+        list_serializer_class = ChatRoomListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # participants_info reads every participant's profile, load them all with the page in two queries. The chosen
+        # proposal tells which messages each room shows to the user (see ReadCursor.unread_counts).
+        return queryset.select_related("project__chosenproposal").prefetch_related(
+            Prefetch("participants", queryset=User.objects.select_related("userprofile"))
+        )
 
     @staticmethod
     def get_project_name(instance):
@@ -89,3 +126,12 @@ class ChatRoomSerializer(serializers.ModelSerializer):
 
     def get_participants_info(self, instance):
         return get_participant(instance, self.context["request"])
+
+    def get_unread_count(self, instance):
+        unread_counts = self.context.get("unread_counts")
+        if unread_counts is None:
+            request = self.context.get("request")
+            if request is None or not request.user.is_authenticated:
+                return 0
+            unread_counts = self.context["unread_counts"] = ReadCursor.unread_counts([instance], request.user)
+        return unread_counts.get(instance.pk, 0)
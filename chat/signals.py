@@ -0,0 +1,114 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from chat.models import ChatRoom, Message, MessageReceiver, ReadCursor
+from chat.tasks import make_message_thumbnails
+from chat.thumbnails import is_image
+from djangofls.consumers import user_group_name
+from user.models import User
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail tasks are queued from this thread, never from the thread that saved the message: it is shared with the
+# other database calls of the consumers and would wait on an unreachable broker.
+thumbnail_dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail-dispatch")
+
+
+def notify_participants_on_commit(event_type, memberships):
+    """Sends event_type to the user group of every (user id, room slug) of memberships once committed."""
+    memberships = list(memberships)
+    if not memberships:
+        return
+
+    def notify():
+        channel_layer = get_channel_layer()
+        for user_id, chat_room in memberships:
+            async_to_sync(channel_layer.group_send)(user_group_name(user_id), {
+                "type": event_type,
+                "chat_room": chat_room,
+            })
+
+    # The change is committed, an unreachable channel layer is logged instead of failing the request that made it.
+    transaction.on_commit(notify, robust=True)
+
+
+def room_memberships(instance, reverse, pk_set, **room_filters):
+    """(user id, room slug) of the participants pk_set of the room instance, or of the rooms pk_set of the user."""
+    if reverse:
+        chat_rooms = ChatRoom.objects.filter(pk__in=pk_set, **room_filters).values_list("slug", flat=True)
+        return [(instance.pk, chat_room) for chat_room in chat_rooms]
+    return [(user_id, instance.slug) for user_id in pk_set]
+
+
+# Multiplexed user sockets (UserChatConsumer) subscribe to the active rooms their user joins while connected, and
+# unsubscribe from the rooms they leave or that are closed or deleted.
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def subscribe_new_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        notify_participants_on_commit("chat_room_joined", room_memberships(instance, reverse, pk_set, status="active"))
+    elif instance.status == "active":
+        notify_participants_on_commit("chat_room_joined", room_memberships(instance, reverse, pk_set))
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def unsubscribe_removed_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_remove" and pk_set:
+        notify_participants_on_commit("chat_room_left", room_memberships(instance, reverse, pk_set))
+    elif action == "pre_clear":
+        # pk_set is None for clear(), the memberships are listed before they are gone.
+        pk_set = instance.chat_rooms.values_list("pk", flat=True) if reverse else \
+            instance.participants.values_list("pk", flat=True)
+        notify_participants_on_commit("chat_room_left", room_memberships(instance, reverse, pk_set))
+
+
+@receiver(post_save, sender=ChatRoom)
+def resubscribe_on_status_change(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "status" not in update_fields):
+        return
+    participants = instance.participants.values_list("pk", flat=True)
+    event_type = "chat_room_joined" if instance.status == "active" else "chat_room_left"
+    notify_participants_on_commit(event_type, room_memberships(instance, False, participants))
+
+
+@receiver(pre_delete, sender=ChatRoom)
+def unsubscribe_deleted_chat_room(sender, instance, **kwargs):
+    notify_participants_on_commit("chat_room_left",
+                                  room_memberships(instance, False, instance.participants.values_list("pk", flat=True)))
+
+
+# The chat database has no foreign key constraints to rooms and users (see chat.routers), their deletion is
+# propagated here the way CASCADE and SET_NULL did.
+@receiver(post_delete, sender=ChatRoom)
+def delete_chat_room_messages(sender, instance, **kwargs):
+    Message.objects.filter(chat_room_id=instance.pk).delete()
+    ReadCursor.objects.filter(chat_room_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=User)
+def detach_deleted_user(sender, instance, **kwargs):
+    Message.objects.filter(sender_id=instance.pk).update(sender=None)
+    MessageReceiver.objects.filter(receiver_id=instance.pk).update(receiver=None)
+    ReadCursor.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Message)
+def thumbnail_attachment(sender, instance, created, **kwargs):
+    if created and instance.file and is_image(instance.file.name):
+        transaction.on_commit(lambda: thumbnail_dispatcher.submit(queue_thumbnails, instance.pk),
+                              using=router.db_for_write(Message))
+
+
+def queue_thumbnails(message_id):
+    # Thumbnails are optional: when the broker is down the error is logged and the message stays without them.
+    try:
+        make_message_thumbnails.apply_async((message_id,), retry=False)
+    except Exception:
+        logger.exception("Could not queue the thumbnails of message %s", message_id)
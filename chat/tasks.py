@@ -0,0 +1,44 @@
+import json
+
+from asgiref.sync import async_to_sync
+from celery import shared_task
+from channels.layers import get_channel_layer
+
+from chat.archive import archive_room, rooms_to_archive
+from chat.models import Message
+from chat.thumbnails import make_thumbnails
+from djangofls.consumers import room_group_name
+
+
+@shared_task
+def archive_closed_chat_rooms():
+    for chat_room in rooms_to_archive():
+        archive_room(chat_room)
+
+
+# Nothing waits for the result, queuing it without the result backend saves its connection retries to the sender.
+@shared_task(ignore_result=True)
+def make_message_thumbnails(message_id):
+    message = Message.objects.filter(pk=message_id).prefetch_related("chat_room").first()
+    if message is None or not message.file or message.thumbnails:
+        return
+    thumbnails = make_thumbnails(message.file)
+    if not thumbnails:
+        return
+    Message.objects.filter(pk=message_id).update(thumbnails=thumbnails)
+    message.thumbnails = thumbnails
+
+    # The message was broadcast without thumbnails, the clients of the room swap them in.
+    chat_room = message.chat_room.slug
+    async_to_sync(get_channel_layer().group_send)(room_group_name(chat_room), {
+        "type": "message_thumbnails",
+        "chat_room": chat_room,
+        "id": message.id,
+        "text": json.dumps({
+            "type": "message_thumbnails",
+            "chat_room": chat_room,
+            "id": message.id,
+            "sequence": message.sequence,
+            "thumbnails": message.thumbnail_urls(),
+        }),
+    })
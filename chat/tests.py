@@ -0,0 +1,490 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.archive import ArchivedMessageList, archive_directory, archive_room, read_manifest
+from chat.models import ChatRoom, Message, MessageReceiver, ReadCursor
+from chat.search import SearchHit
+from chat.signals import thumbnail_dispatcher
+from chat.throttling import OutboundQueue, OutboundQueueFull
+from djangofls import routing
+from djangofls.celery import app
+from djangofls.consumers import ChatConsumer
+from djangofls.jwt_middleware import JWTAuthMiddlewareStack
+from project.models import ChosenProposal, Project, ProjectProposal
+from user.models import User
+
+
+def create_user(username):
+    return User.objects.create_user("Test", "User", username, f"{username}@example.com", "password", is_active=True)
+
+
+def websocket(application, path, user):
+    return WebsocketCommunicator(application, f"{path}?token={AccessToken.for_user(user)}")
+
+
+async def receive_type(communicator, type):
+    """The next frame of the given type sent to the socket, skipping the others."""
+    while True:
+        frame = json.loads(await communicator.receive_from(timeout=5))
+        if frame.get("type") == type:
+            return frame
+
+
+class SecondWorkerChatConsumer(ChatConsumer):
+    # Stands for a ChatConsumer running in another Daphne worker, with a layer connection of its own.
+    channel_layer_alias = "second_worker"
+
+
+FAKE_REDIS_LAYER = {
+    "BACKEND": "djangofls.channel_layers.FakeRedisChannelLayer",
+    "CONFIG": {"server_name": "fan_out_tests"},
+}
+
+
+@override_settings(CHANNEL_LAYERS={"default": FAKE_REDIS_LAYER, "second_worker": FAKE_REDIS_LAYER})
+class ChannelLayerFanOutTests(TransactionTestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.sender, self.receiver = create_user("sender"), create_user("receiver")
+        self.chat_room = ChatRoom.objects.create()
+        self.chat_room.participants.add(self.sender, self.receiver)
+
+    async def test_group_send_reaches_a_consumer_of_another_layer_instance(self):
+        first_worker = JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+        second_worker = JWTAuthMiddlewareStack(URLRouter([
+            path("ws/<str:room_name>/", SecondWorkerChatConsumer.as_asgi()),
+        ]))
+        self.assertIsNot(get_channel_layer("default"), get_channel_layer("second_worker"))
+
+        sender = websocket(first_worker, f"/ws/{self.chat_room.slug}/", self.sender)
+        receiver = websocket(second_worker, f"/ws/{self.chat_room.slug}/", self.receiver)
+        self.assertTrue((await sender.connect())[0])
+        self.assertTrue((await receiver.connect())[0])
+        try:
+            await sender.send_to(text_data=json.dumps({"type": "message", "content": "Hello"}))
+            frame = await receive_type(receiver, "chat_message")
+            self.assertEqual(frame["content"], "Hello")
+            self.assertEqual(frame["username"], "sender")
+        finally:
+            await sender.disconnect()
+            await receiver.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class UserChatConsumerUploadTests(TransactionTestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.user = create_user("uploader")
+        self.chat_room = ChatRoom.objects.create()
+        self.chat_room.participants.add(self.user)
+
+    async def test_upload_abort_is_routed_by_upload_id(self):
+        communicator = websocket(JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns)),
+                                 "/ws/user/chats/", self.user)
+        self.assertTrue((await communicator.connect())[0])
+        try:
+            await receive_type(communicator, "subscribed")
+            await communicator.send_to(text_data=json.dumps({
+                "type": "upload_begin", "chat_room": self.chat_room.slug, "name": "a.png", "size": 10, "hash": "0",
+            }))
+            upload = (await receive_type(communicator, "upload_ready"))["upload"]
+
+            await communicator.send_to(text_data=json.dumps({"type": "upload_abort", "upload": "another"}))
+            await communicator.send_to(text_data=json.dumps({"type": "upload_abort", "upload": upload}))
+            await communicator.send_to(bytes_data=b"chunk")
+            self.assertEqual(json.loads(await communicator.receive_from(timeout=5)),
+                             {"error": "No upload in progress."})
+        finally:
+            await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class UserChatSubscriptionTests(TransactionTestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.user = create_user("member")
+        self.first_room, self.second_room = ChatRoom.objects.create(), ChatRoom.objects.create()
+        for chat_room in [self.first_room, self.second_room]:
+            chat_room.participants.add(self.user)
+
+    async def test_rooms_left_or_closed_are_unsubscribed(self):
+        communicator = websocket(JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns)),
+                                 "/ws/user/chats/", self.user)
+        self.assertTrue((await communicator.connect())[0])
+        try:
+            self.assertEqual((await receive_type(communicator, "subscribed"))["chat_rooms"],
+                             sorted([self.first_room.slug, self.second_room.slug]))
+
+            await database_sync_to_async(self.first_room.participants.remove)(self.user)
+            self.assertEqual((await receive_type(communicator, "unsubscribed"))["chat_rooms"], [self.first_room.slug])
+
+            self.second_room.status = "closed"
+            await database_sync_to_async(self.second_room.save)(update_fields=["status"])
+            self.assertEqual((await receive_type(communicator, "unsubscribed"))["chat_rooms"], [self.second_room.slug])
+        finally:
+            await communicator.disconnect()
+
+    def test_an_unreachable_channel_layer_does_not_fail_the_change(self):
+        with patch("chat.signals.get_channel_layer") as get_channel_layer, \
+                self.assertLogs("django.db.backends.base", "ERROR"):
+            get_channel_layer.return_value.group_send = AsyncMock(side_effect=ConnectionError)
+            self.first_room.participants.remove(self.user)
+        self.assertFalse(self.first_room.participants.filter(pk=self.user.pk).exists())
+
+
+class ChatRoomQueryCountTests(TestCase):
+    """Queries of the room endpoints on the (default, chat) databases, the same for one room as for a full page."""
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.user = create_user("member")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_rooms(self, count, participants=3):
+        chat_rooms = []
+        for i in range(count):
+            chat_room = ChatRoom.objects.create()
+            others = [create_user(f"room{chat_room.pk}_{j}") for j in range(participants - 1)]
+            chat_room.participants.add(self.user, *others)
+            Message.objects.create(chat_room=chat_room, sender=others[0], content="Hello")
+            chat_rooms.append(chat_room)
+        return chat_rooms
+
+    @staticmethod
+    def close(chat_rooms):
+        ChatRoom.objects.filter(pk__in=[chat_room.pk for chat_room in chat_rooms]).update(status="closed")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connections["default"]) as default, \
+                CaptureQueriesContext(connections["chat"]) as chat:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(default), len(chat)
+
+    def assertQueries(self, url, expected):
+        self.assertEqual(self.count_queries(url), expected, f"(default, chat) queries of {url}")
+
+    def test_list_queries_do_not_grow_with_rooms_or_participants(self):
+        self.create_rooms(1)
+        self.assertQueries("/chat/", (3, 1))
+        self.create_rooms(4, participants=6)
+        self.assertQueries("/chat/", (3, 1))
+
+    def test_detail_queries_do_not_grow_with_participants(self):
+        small, large = self.create_rooms(1)[0], self.create_rooms(1, participants=8)[0]
+        self.assertQueries(f"/chat/{small.slug}/", (2, 1))
+        self.assertQueries(f"/chat/{large.slug}/", (2, 1))
+
+    def test_closed_chat_queries_do_not_grow_with_rooms(self):
+        self.close(self.create_rooms(1))
+        self.assertQueries("/chat/closed_chat/", (3, 1))
+        self.close(self.create_rooms(4, participants=6))
+        self.assertQueries("/chat/closed_chat/", (3, 1))
+
+
+class MessageSearchViewTests(TestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.user = create_user("searcher")
+        self.chat_room = ChatRoom.objects.create()
+        self.chat_room.participants.add(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_hits_of_deleted_messages_are_skipped(self):
+        kept = Message.objects.create(chat_room=self.chat_room, sender=self.user, content="hello there")
+        deleted = Message.objects.create(chat_room=self.chat_room, sender=self.user, content="hello again")
+        hits = [SearchHit(deleted.pk, -2.0, "hello again"), SearchHit(kept.pk, -1.0, "hello there")]
+        deleted.delete()
+
+        with patch("chat.views.get_search_backend") as get_search_backend:
+            get_search_backend.return_value.search.return_value = (hits, None)
+            response = self.client.get(f"/chat/{self.chat_room.slug}/search/", {"q": "hello"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message["id"] for message in response.data["results"]], [kept.pk])
+
+
+class ArchiveRoomTests(TestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.user = create_user("archiver")
+        self.chat_room = ChatRoom.objects.create(status="closed")
+        self.chat_room.participants.add(self.user)
+        archive_root = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_root.cleanup)
+        self.enterContext(override_settings(CHAT_ARCHIVE_ROOT=archive_root.name, CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        }))
+
+    def send(self, count):
+        # The room is updated once the messages are committed.
+        with self.captureOnCommitCallbacks(using="chat", execute=True):
+            for i in range(count):
+                Message.objects.create(chat_room=self.chat_room, sender=self.user, content=f"Message {i}")
+        self.chat_room.refresh_from_db()
+
+    def test_archived_messages_leave_the_message_count_and_no_temporary_file(self):
+        self.send(3)
+        self.assertEqual(self.chat_room.message_count, 3)
+
+        self.assertEqual(archive_room(self.chat_room, batch_size=2), 3)
+
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.message_count, 0)
+        self.assertEqual(read_manifest(self.chat_room)["messages"], 3)
+        self.assertFalse([name for name in os.listdir(archive_directory(self.chat_room)) if name.endswith(".tmp")])
+
+    def test_failed_archive_removes_its_temporary_files(self):
+        Message.objects.create(chat_room=self.chat_room, sender=self.user, content="Hello")
+        with patch("chat.archive.serialize_message", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                archive_room(self.chat_room)
+
+        self.assertEqual(os.listdir(archive_directory(self.chat_room)), [])
+        self.assertEqual(Message.objects.filter(chat_room=self.chat_room).count(), 1)
+
+    def test_archiving_again_switches_to_a_new_archive_through_the_manifest(self):
+        self.send(2)
+        archive_room(self.chat_room)
+        previous = read_manifest(self.chat_room)["archive"]
+        self.chat_room.refresh_from_db()
+        self.send(1)
+        archive_room(self.chat_room)
+
+        manifest = read_manifest(self.chat_room)
+        self.assertEqual(manifest["messages"], 3)
+        self.assertNotEqual(manifest["archive"], previous)
+        self.assertEqual(sorted(os.listdir(archive_directory(self.chat_room))),
+                         sorted([manifest["archive"], f"{self.chat_room.slug}.json"]))
+
+    def test_sync_reads_the_archive_before_the_hot_messages(self):
+        self.send(5)
+        archive_room(self.chat_room)
+        self.chat_room.refresh_from_db()
+        self.send(2)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        def sync(**params):
+            data = client.get(f"/chat/{self.chat_room.slug}/sync/", params).data
+            return [message["sequence"] for message in data["messages"]], data["has_more"]
+
+        self.assertEqual(sync(after=0, limit=3), ([1, 2, 3], True))
+        self.assertEqual(sync(after=3, limit=3), ([4, 5, 6], True))
+        self.assertEqual(sync(after=5, limit=3), ([6, 7], False))
+        self.assertEqual(sync(limit=3), ([5, 6, 7], True))
+        self.assertEqual(sync(before=5, limit=3), ([2, 3, 4], True))
+        self.assertEqual(sync(before=3), ([1, 2], False))
+
+    def test_visible_archived_messages_are_counted_once_per_archive(self):
+        self.send(3)
+        archive_room(self.chat_room)
+        self.chat_room.refresh_from_db()
+        hot_messages = Message.objects.filter(chat_room=self.chat_room)
+        since = timezone.now() - timedelta(days=1)
+        self.assertEqual(ArchivedMessageList(self.chat_room, hot_messages, since=since).count(), 3)
+
+        with patch("chat.archive.ArchiveReader.records", side_effect=AssertionError("archive scanned")):
+            self.assertEqual(ArchivedMessageList(self.chat_room, hot_messages, since=since).count(), 3)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.queue = OutboundQueue(send=None, max_size=2)
+
+    def test_full_queue_drops_typing_and_status_updates_first(self):
+        self.queue.put("typing", key=("typing", "room", "alice"))
+        self.queue.put("message 1")
+        self.queue.put("message 2")
+        self.queue.put("status", key=("status", "room", "alice"))
+        self.assertEqual(list(self.queue.pending.values()), ["message 1", "message 2"])
+
+    def test_full_queue_never_drops_thumbnails(self):
+        self.queue.put("message")
+        self.queue.put("thumbnails 1", key=("thumbnails", "room", 1))
+        with self.assertRaises(OutboundQueueFull):
+            self.queue.put("thumbnails 2", key=("thumbnails", "room", 2))
+        self.assertEqual(list(self.queue.pending.values()), ["message", "thumbnails 1"])
+
+    def test_updates_of_the_same_state_are_coalesced(self):
+        self.queue.put("thumbnails", key=("thumbnails", "room", 1))
+        self.queue.put("thumbnails again", key=("thumbnails", "room", 1))
+        self.assertEqual(list(self.queue.pending.values()), ["thumbnails again"])
+
+
+class MoveChatDatabaseTests(TransactionTestCase):
+    """move_chat_database on a default database whose chat tables were left as they were before the chat database."""
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        state = MigrationExecutor(connections["default"]).loader.project_state(("chat", "0020_alter_message_file"))
+        self.LegacyMessage = state.apps.get_model("chat", "Message")
+        self.LegacyMessageReceiver = state.apps.get_model("chat", "MessageReceiver")
+        with connections["default"].schema_editor() as schema_editor:
+            schema_editor.create_model(self.LegacyMessage)
+            schema_editor.create_model(self.LegacyMessageReceiver)
+        self.addCleanup(self.drop_legacy_tables)
+
+    def drop_legacy_tables(self):
+        with connections["default"].schema_editor() as schema_editor:
+            schema_editor.delete_model(self.LegacyMessageReceiver)
+            schema_editor.delete_model(self.LegacyMessage)
+
+    def legacy_message(self, chat_room, sender, content, timestamp):
+        message = self.LegacyMessage.objects.using("default").create(chat_room_id=chat_room.pk, sender_id=sender.pk,
+                                                                     content=content)
+        self.LegacyMessage.objects.using("default").filter(pk=message.pk).update(timestamp=timestamp)
+        return message
+
+    def test_legacy_rows_are_numbered_and_read_cursors_backfilled(self):
+        alice, bob = create_user("alice"), create_user("bob")
+        first_room, second_room = ChatRoom.objects.create(), ChatRoom.objects.create()
+        now = timezone.now()
+        # Ids and timestamps in a different order: sequences follow the timestamps.
+        late = self.legacy_message(first_room, alice, "late", now)
+        early = self.legacy_message(first_room, bob, "early", now - timedelta(minutes=1))
+        other = self.legacy_message(second_room, alice, "other", now)
+        for message, is_seen in [(late, False), (early, True), (other, True)]:
+            self.LegacyMessageReceiver.objects.using("default").create(message_id=message.pk, is_seen=is_seen,
+                                                                       receiver_id=bob.pk)
+
+        call_command("move_chat_database", "--delete", "--batch-size", "2", stdout=StringIO())
+
+        self.assertEqual(
+            list(Message.objects.order_by("chat_room", "sequence").values_list("id", "chat_room", "sequence")),
+            [(early.pk, first_room.pk, 1), (late.pk, first_room.pk, 2), (other.pk, second_room.pk, 1)],
+        )
+        self.assertEqual(MessageReceiver.objects.count(), 3)
+        self.assertEqual(
+            set(ReadCursor.objects.values_list("chat_room", "user", "last_read_id")),
+            {(first_room.pk, bob.pk, early.pk), (second_room.pk, bob.pk, other.pk)},
+        )
+        first_room.refresh_from_db()
+        self.assertEqual((first_room.message_count, first_room.last_message_preview), (2, "late"))
+        self.assertFalse(self.LegacyMessage.objects.using("default").exists())
+        self.assertFalse(self.LegacyMessageReceiver.objects.using("default").exists())
+
+
+class RoomMetadataTests(TestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.user = create_user("writer")
+        self.chat_room = ChatRoom.objects.create()
+
+    def test_rolled_back_message_leaves_the_room_untouched(self):
+        with self.captureOnCommitCallbacks(using="chat", execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic(using="chat"):
+                Message.objects.create(chat_room=self.chat_room, sender=self.user, content="Rolled back")
+                raise RuntimeError
+        self.chat_room.refresh_from_db()
+        self.assertEqual((self.chat_room.message_count, self.chat_room.last_message_preview), (0, ""))
+
+    def test_backfill_handles_a_batch_of_many_rooms(self):
+        chat_rooms = ChatRoom.objects.bulk_create([ChatRoom(slug=f"room-{i}") for i in range(1000)])
+        Message.objects.bulk_create([
+            Message(chat_room=chat_room, sender=self.user, content=f"{chat_room.slug} {sequence}", sequence=sequence)
+            for chat_room in chat_rooms for sequence in [1, 2]
+        ])
+
+        call_command("backfill_chat_rooms", stdout=StringIO())
+
+        self.assertEqual(ChatRoom.objects.filter(message_count=2).count(), 1000)
+        self.assertEqual(ChatRoom.objects.get(slug="room-7").last_message_preview, "room-7 2")
+
+
+    def test_unread_counts_leave_out_the_messages_the_user_can_not_see(self):
+        freelancer = create_user("freelancer")
+        project = Project.objects.create(published_user=self.user, title="Project", description="Description",
+                                         min_price=100, max_price=200, due_date=date.today() + timedelta(days=30),
+                                         proposal_time_end=date.today() + timedelta(days=10))
+        proposal = ProjectProposal.objects.create(project=project, proposer=freelancer, proposal_text="Proposal",
+                                                  proposed_price=150, submission_date=date.today() + timedelta(days=5))
+        chosen_proposal = ChosenProposal.objects.create(project=project, selected_proposal=proposal)
+        chat_room = ChatRoom.objects.get(project=project)
+        before = Message.objects.create(chat_room=chat_room, sender=self.user, content="Before the proposal")
+        Message.objects.filter(pk=before.pk).update(timestamp=chosen_proposal.chosen_date - timedelta(days=1))
+        Message.objects.create(chat_room=chat_room, sender=self.user, content="After the proposal")
+
+        self.assertEqual(ReadCursor.unread_count(chat_room, freelancer), 1)
+        client = APIClient()
+        client.force_authenticate(freelancer)
+        self.assertEqual(client.get("/chat/").data["results"][0]["unread_count"], 1)
+
+
+class ThumbnailAttachmentTests(TestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        self.user = create_user("photographer")
+        self.chat_room = ChatRoom.objects.create()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def send_file(self, name):
+        with self.captureOnCommitCallbacks(using="chat", execute=True):
+            Message.objects.create(chat_room=self.chat_room, sender=self.user, file=ContentFile(b"data", name=name))
+
+    @patch("chat.signals.thumbnail_dispatcher")
+    def test_only_images_are_queued(self, thumbnail_dispatcher):
+        self.send_file("notes.pdf")
+        thumbnail_dispatcher.submit.assert_not_called()
+        self.send_file("photo.JPG")
+        thumbnail_dispatcher.submit.assert_called_once()
+
+    def use_broker(self, url):
+        # The connection pools of the Celery app are bound to the broker they were first created for.
+        app.conf.broker_write_url = url
+        app._pool = app.amqp._producer_pool = None
+
+    def test_unresponsive_broker_does_not_hold_the_sender(self):
+        # Accepts connections and never answers, like a broker that hangs.
+        server = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(server.close)
+        clients = []
+        threading.Thread(target=lambda: clients.append(server.accept()), daemon=True).start()
+        broker_url, transport_options = app.conf.broker_write_url, app.conf.broker_transport_options
+        self.use_broker(f"redis://127.0.0.1:{server.getsockname()[1]}/0")
+        app.conf.broker_transport_options = {"socket_timeout": 1, "socket_connect_timeout": 1}
+        self.addCleanup(setattr, app.conf, "broker_transport_options", transport_options)
+        self.addCleanup(self.use_broker, broker_url)
+
+        with self.assertLogs("chat.signals", "ERROR"):
+            started = time.monotonic()
+            self.send_file("photo.png")
+            elapsed = time.monotonic() - started
+            # Waits for the dispatch thread to give up on the broker.
+            thumbnail_dispatcher.submit(lambda: None).result(timeout=10)
+        self.assertLess(elapsed, 0.5)
+        self.assertTrue(clients)
+        self.assertEqual(Message.objects.filter(chat_room=self.chat_room).count(), 1)
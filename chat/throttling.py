@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+# Process wide counters of the websocket limiters and outbound queues, served by ChatMetricsView.
+metrics = Counter()
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self):
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_full(self):
+        self.refill()
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """
+    Token buckets of one websocket connection, one per kind of frame (CHAT_CONNECTION_RATE_LIMITS), backed by
+    buckets shared by all the connections of the same user on this worker (CHAT_USER_RATE_LIMITS).
+    """
+    user_buckets = {}
+    max_user_buckets = 10000
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.buckets = {kind: TokenBucket(*limit) for kind, limit in settings.CHAT_CONNECTION_RATE_LIMITS.items()}
+
+    def user_bucket(self, kind):
+        key = (self.user_id, kind)
+        bucket = self.user_buckets.get(key)
+        if bucket is None:
+            if len(self.user_buckets) >= self.max_user_buckets:
+                # Full buckets are in the same state as new ones, forgetting them changes nothing.
+                for full_key in [k for k, b in self.user_buckets.items() if b.is_full()]:
+                    del self.user_buckets[full_key]
+            bucket = self.user_buckets[key] = TokenBucket(*settings.CHAT_USER_RATE_LIMITS[kind])
+        return bucket
+
+    def throttle(self, kind):
+        """Takes a token from the connection and the user buckets of kind, returns the seconds to wait if empty."""
+        bucket = self.buckets[kind]
+        user_bucket = self.user_bucket(kind)
+        bucket.refill()
+        user_bucket.refill()
+        if bucket.tokens < 1 or user_bucket.tokens < 1:
+            metrics[f"rate_limited.{kind}"] += 1
+            return max(bucket.retry_after(), user_bucket.retry_after())
+        bucket.tokens -= 1
+        user_bucket.tokens -= 1
+        metrics[f"allowed.{kind}"] += 1
+        return None
+
+
+class OutboundQueueFull(Exception):
+    pass
+
+
+class OutboundQueue:
+    """
+    Bounded queue of the frames waiting to be written to a websocket.
+
+    Frames put with a key are updates of a state: a newer one replaces the one still queued under the same key.
+    Only the keys of droppable_kinds (typing and read status, the first item of the key) can be dropped when the
+    queue is full, the next update of the same state repairs them. Other frames, thumbnails included, are never
+    dropped, OutboundQueueFull is raised when one does not fit and the client is expected to reconnect and resync.
+
+    max_size bounds the frames waiting for this consumer's send(), not the bytes unread by the client: Daphne's
+    send() returns once the frame is handed to the server, whose transport buffers it without limit. The queue only
+    fills when the consumer is starved (a busy event loop, a slow channel layer), queue.max_depth in the metrics
+    shows how close the workers come to it.
+    """
+    droppable_kinds = {"typing", "status"}
+
+    def __init__(self, send, max_size=None):
+        self.send = send
+        self.max_size = max_size or settings.CHAT_OUTBOUND_QUEUE_SIZE
+        self.pending = OrderedDict()
+        self.counter = itertools.count()
+        self.ready = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def put(self, text, key=None):
+        if key is not None and key in self.pending:
+            self.pending[key] = text
+            metrics["queue.coalesced"] += 1
+            return
+
+        if len(self.pending) >= self.max_size:
+            if self.is_droppable(key):
+                metrics["queue.dropped"] += 1
+                return
+            droppable = next((k for k in self.pending if self.is_droppable(k)), None)
+            if droppable is None:
+                metrics["queue.overflow"] += 1
+                raise OutboundQueueFull
+            del self.pending[droppable]
+            metrics["queue.dropped"] += 1
+
+        self.pending[key if key is not None else next(self.counter)] = text
+        metrics["queue.max_depth"] = max(metrics["queue.max_depth"], len(self.pending))
+        self.ready.set()
+
+    def is_droppable(self, key):
+        return isinstance(key, tuple) and key[0] in self.droppable_kinds
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            while self.pending:
+                key, text = self.pending.popitem(last=False)
+                await self.send(text_data=text)
+                metrics["queue.sent"] += 1
+            self.ready.clear()
@@ -0,0 +1,41 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+def thumbnail_name(name, size):
+    return f"{os.path.splitext(name)[0]}_{size}.webp"
+
+
+def is_image(name):
+    """Whether name has the extension of an image format Pillow can decode, the attachments that get thumbnails."""
+    extension = os.path.splitext(name)[1].lower()
+    return Image.registered_extensions().get(extension) in Image.OPEN
+
+
+def make_thumbnails(file):
+    """
+    Saves a WebP thumbnail of the image in file for each of CHAT_THUMBNAIL_SIZES, next to the original, and returns
+    their names by size. Returns None when file is not an image Pillow can decode (only the first frame of animated
+    and multi-page images is used).
+    """
+    try:
+        with file.open("rb") as f, Image.open(f) as image:
+            largest = max(settings.CHAT_THUMBNAIL_SIZES.values())
+            # JPEG can decode at a fraction of its size, a large photo is never fully decoded for small thumbnails.
+            image.draft("RGB", (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            thumbnails = {}
+            for size, pixels in sorted(settings.CHAT_THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+                # Sizes are made from the largest down, each one resampled from the previous.
+                image.thumbnail((pixels, pixels), Image.LANCZOS)
+                content = io.BytesIO()
+                image.save(content, "WEBP", quality=settings.CHAT_THUMBNAIL_QUALITY, method=4)
+                thumbnails[size] = file.storage.save(thumbnail_name(file.name, size), ContentFile(content.getvalue()))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+    return thumbnails
@@ -0,0 +1,67 @@
+import hashlib
+import uuid
+
+import filetype
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.utils.translation import gettext as _
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChunkedUpload:
+    """
+    Attachment received over the chat websocket as a sequence of binary frames.
+
+    Chunks are appended to a temporary file as they arrive, the file type is detected on the first chunk and the
+    sha256 of the whole file is checked against the one announced by the client before it is committed.
+    The methods are blocking and are meant to run in a worker thread.
+    """
+
+    def __init__(self, name, size, checksum):
+        max_size = settings.CHAT_UPLOAD_MAX_SIZE
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError(_("Invalid file size."))
+        if size > max_size:
+            raise UploadError(_("File is larger than {max_size} bytes.").format(max_size=max_size))
+        if not checksum:
+            raise UploadError(_("File hash is required."))
+
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.size = size
+        self.checksum = str(checksum).lower()
+        self.received = 0
+        self.kind = None
+        self.digest = hashlib.sha256()
+        self.file = None
+
+    def write(self, chunk):
+        if self.received + len(chunk) > self.size:
+            raise UploadError(_("Received more data than the announced file size."))
+
+        if self.file is None:
+            self.kind = filetype.guess(chunk)
+            if not self.kind:
+                raise UploadError(_("Unsupported file type."))
+            file_name = f"{uuid.uuid4()}.{self.kind.extension}"
+            self.file = TemporaryUploadedFile(file_name, self.kind.mime, self.size, None)
+
+        self.file.write(chunk)
+        self.digest.update(chunk)
+        self.received += len(chunk)
+
+    def commit(self):
+        if self.file is None or self.received != self.size:
+            raise UploadError(_("Upload is incomplete."))
+        if self.digest.hexdigest() != self.checksum:
+            raise UploadError(_("File hash does not match."))
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
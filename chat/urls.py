@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from chat.views import ChatRoomView
+from chat.views import ChatRoomView, ChatMetricsView
 
 router = DefaultRouter()
 router.register("chat", ChatRoomView, basename="chat")
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("chat-metrics/", ChatMetricsView.as_view(), name="chat-metrics"),
 ]
@@ -1,17 +1,18 @@
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Max, F
-from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 
 from rest_framework import mixins, viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
 
-from chat.models import ChatRoom, Message
-from chat.pagination import ChatPagination
+from chat.archive import ArchivedMessageList
+from chat.models import ChatRoom, Message, ReadCursor
+from chat.pagination import ChatPagination, SequencePagination
 from chat.permissions import IsParticipantAndClosedPermission
+from chat.search import SearchError, get_search_backend, render_highlight
 from chat.serializers import ChatRoomSerializer, MessageSerializer
+from chat.throttling import metrics
 
 
 class ChatRoomView(mixins.ListModelMixin,
@@ -33,20 +34,21 @@ class ChatRoomView(mixins.ListModelMixin,
         elif self.action == "list":
             queryset = queryset.filter(participants=user, status="active")
 
-        queryset = queryset.annotate(last_message_timestamp=Coalesce(Max("messages__timestamp"), F("created")))
-        queryset = queryset.order_by("-last_message_timestamp", "-created")
+        queryset = queryset.order_by("-last_message_at", "-created")
+        if self.action in ["list", "retrieve"]:
+            queryset = ChatRoomSerializer.setup_eager_loading(queryset)
 
         return queryset
 
     def get_permissions(self):
-        if self.action == "message":
+        if self.action in ["message", "sync", "search"]:
             self.permission_classes = [IsAuthenticated, IsParticipantAndClosedPermission]
         return super().get_permissions()
 
     def get_serializer_class(self):
         if self.action == "closed_chat":
             return ChatRoomSerializer
-        elif self.action == "message":
+        elif self.action in ["message", "sync", "search"]:
             return MessageSerializer
         return self.serializer_class
 
@@ -69,7 +71,7 @@ class ChatRoomView(mixins.ListModelMixin,
         else:
             closed_proposals = ChatRoom.objects.filter(participants=user, status="closed").order_by("-modified_date")
 
-        closed_proposals = self.filter_queryset(closed_proposals)
+        closed_proposals = ChatRoomSerializer.setup_eager_loading(self.filter_queryset(closed_proposals))
 
         page = self.paginate_queryset(closed_proposals)
         if page is not None:
@@ -84,25 +86,18 @@ class ChatRoomView(mixins.ListModelMixin,
         chatroom = self.get_object()
         if request.method == "GET":
             try:
-                try:
-                    chosen_proposal_time = chatroom.project.chosenproposal.chosen_date
-                    published_user = chatroom.project.published_user
-                except ObjectDoesNotExist:
-                    chosen_proposal_time = None
-                    published_user = None
-
-                if chosen_proposal_time and self.request.user != published_user:
-                    message_room = Message.objects.filter(chat_room=chatroom,
-                                                          timestamp__gte=chosen_proposal_time).order_by("-timestamp")
-                else:
-                    message_room = Message.objects.filter(chat_room=chatroom).order_by("-timestamp")
+                message_room = chatroom.visible_messages(self.request.user).order_by("-timestamp")
+                if chatroom.archived_at:
+                    message_room = ArchivedMessageList(chatroom, message_room,
+                                                       since=chatroom.visible_since(self.request.user))
 
+                context = {**self.get_serializer_context(), "read_cursors": ReadCursor.room_cursors(chatroom)}
                 page = self.paginate_queryset(message_room)
                 if page is not None:
-                    serializer = self.get_serializer(page, many=True)
+                    serializer = self.get_serializer(page, many=True, context=context)
                     return self.get_paginated_response(serializer.data)
                 else:
-                    serializer = self.get_serializer(message_room, many=True)
+                    serializer = self.get_serializer(message_room, many=True, context=context)
                     return Response(serializer.data)
             except ChatRoom.DoesNotExist:
                 return Response({"error": _("Chatroom not found")}, status=status.HTTP_404_NOT_FOUND)
@@ -119,3 +114,56 @@ class ChatRoomView(mixins.ListModelMixin,
                 return Response({"message": _("Message sent successfully"), "data": serializer.data},
                                 status=status.HTTP_201_CREATED)
             return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=["get"])
+    def sync(self, request, slug=None):
+        chatroom = self.get_object()
+        try:
+            paginator = SequencePagination(request.query_params.get("after"), request.query_params.get("before"),
+                                           request.query_params.get("limit"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = chatroom.visible_messages(self.request.user).prefetch_related("sender")
+        if chatroom.archived_at:
+            messages = ArchivedMessageList(chatroom, messages, since=chatroom.visible_since(self.request.user))
+            messages, has_more = messages.paginate_sequence(paginator)
+        else:
+            messages, has_more = paginator.paginate(messages)
+        context = {**self.get_serializer_context(), "read_cursors": ReadCursor.room_cursors(chatroom)}
+        serializer = self.get_serializer(messages, many=True, context=context)
+        return Response({"messages": serializer.data, "has_more": has_more})
+
+    @action(detail=True, methods=["get"])
+    def search(self, request, slug=None):
+        chatroom = self.get_object()
+        try:
+            limit = SequencePagination.parse(request.query_params.get("limit"), "limit")
+            hits, next_cursor = get_search_backend().search(
+                chatroom, request.query_params.get("q", ""), since=chatroom.visible_since(self.request.user),
+                cursor=request.query_params.get("cursor"),
+                limit=min(limit or SequencePagination.default_limit, SequencePagination.max_limit),
+            )
+        except (SearchError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = Message.objects.prefetch_related("sender").in_bulk([hit.message_id for hit in hits])
+        context = {**self.get_serializer_context(), "read_cursors": ReadCursor.room_cursors(chatroom)}
+        results = []
+        for hit in hits:
+            if hit.message_id not in messages:
+                # Deleted, or moved to the archive, since the index was read.
+                continue
+            data = self.get_serializer(messages[hit.message_id], context=context).data
+            data["highlight"] = render_highlight(hit.highlight)
+            results.append(data)
+        # Archived messages are not indexed, only the ones sent since the room was archived are searched.
+        return Response({"results": results, "next": next_cursor, "archived": chatroom.archived_at is not None})
+
+
+class ChatMetricsView(APIView):
+    """Websocket rate limiter and outbound queue counters of the worker serving the request."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(dict(metrics))
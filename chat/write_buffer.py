@@ -0,0 +1,123 @@
+import asyncio
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import router, transaction, IntegrityError
+from django.db.models import Count, Max
+
+from chat.models import ChatRoom, Message
+from chat.throttling import metrics
+
+
+def write_messages(entries):
+    """
+    Saves the (user, chat room slug, content) entries with one bulk INSERT in a single transaction of the chat
+    database and returns a (message, chat_room) pair for each entry, None for entries whose room does not exist.
+
+    Message.save() is bypassed, so the sequences are assigned here: each room continues after its highest sequence
+    (or its archived messages) in the order of the entries. A concurrent writer that took the same numbers makes the
+    transaction fail on the (chat_room, sequence) constraint and the whole batch is retried.
+    """
+    chat_rooms = ChatRoom.objects.annotate(participants_count=Count("participants")).in_bulk(
+        {slug for _, slug, _ in entries}, field_name="slug")
+    for attempt in range(3):
+        try:
+            with transaction.atomic(using=router.db_for_write(Message)):
+                messages = insert_messages(entries, chat_rooms)
+            break
+        except IntegrityError:
+            if attempt == 2:
+                raise
+    return [(message, chat_rooms[slug]) if message else None for message, (_, slug, _) in zip(messages, entries)]
+
+
+def insert_messages(entries, chat_rooms):
+    last_sequences = dict(
+        Message.objects.filter(chat_room__in=[chat_room.pk for chat_room in chat_rooms.values()])
+        .order_by().values("chat_room").annotate(last=Max("sequence")).values_list("chat_room", "last")
+    )
+    messages = []
+    last_messages = {}
+    for user, slug, content in entries:
+        chat_room = chat_rooms.get(slug)
+        if chat_room is None:
+            messages.append(None)
+            continue
+        sequence = last_sequences.get(chat_room.pk, chat_room.archived_sequence) + 1
+        last_sequences[chat_room.pk] = sequence
+        message = Message(chat_room=chat_room, sender=user, content=content, sequence=sequence)
+        messages.append(message)
+        last_messages.setdefault(chat_room.pk, []).append(message)
+
+    Message.objects.bulk_create([message for message in messages if message])
+    transaction.on_commit(lambda: record_rooms(last_messages), using=router.db_for_write(Message))
+    return messages
+
+
+def record_rooms(last_messages):
+    # Once the batch is committed, its rooms are updated in a single transaction of the default database.
+    with transaction.atomic(using=router.db_for_write(ChatRoom)):
+        for room_messages in last_messages.values():
+            ChatRoom.record_messages(room_messages[-1], count=len(room_messages))
+
+
+class MessageWriteBuffer:
+    """
+    Group commit of the text messages sent over the chat websockets of this worker (CHAT_WRITE_BUFFER).
+
+    Messages are collected for CHAT_WRITE_BUFFER_DELAY seconds, or until CHAT_WRITE_BUFFER_SIZE are waiting, and
+    saved together by write_messages(). save() only returns once the batch is committed, so a message is never
+    broadcast before it is durable.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.flush_task = None
+        self.flushing = set()
+
+    async def save(self, user, chat_room, content):
+        loop = asyncio.get_running_loop()
+        if self.flush_task is not None and self.flush_task.get_loop() is not loop:
+            # Left over from a closed event loop (management commands, tests), it will never run.
+            self.pending, self.flush_task, self.flushing = [], None, set()
+
+        future = loop.create_future()
+        self.pending.append(((user, chat_room, content), future))
+        if len(self.pending) >= settings.CHAT_WRITE_BUFFER_SIZE:
+            task = asyncio.create_task(self.flush())
+            # The event loop only keeps weak references to its tasks.
+            self.flushing.add(task)
+            task.add_done_callback(self.flushing.discard)
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+        return await future
+
+    async def flush_later(self):
+        await asyncio.sleep(settings.CHAT_WRITE_BUFFER_DELAY)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            results = await database_sync_to_async(write_messages)([entry for entry, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        metrics["write_buffer.batches"] += 1
+        metrics["write_buffer.messages"] += len(batch)
+        for ((_, chat_room, _), future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result is None:
+                future.set_exception(ChatRoom.DoesNotExist(f"Chat room {chat_room} does not exist."))
+            else:
+                future.set_result(result)
+
+
+write_buffer = MessageWriteBuffer()
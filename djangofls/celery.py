@@ -34,6 +34,10 @@ app.conf.beat_schedule = {
         # "schedule": crontab(minute="*/1"),
 
     },
+    "archive_closed_chat_rooms": {
+        "task": "chat.tasks.archive_closed_chat_rooms",
+        "schedule": crontab(minute="0", hour="3"),
+    },
 }
 
 app.autodiscover_tasks()
@@ -0,0 +1,24 @@
+from channels_redis.core import RedisChannelLayer
+from redis.asyncio import ConnectionPool
+
+
+class FakeRedisChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer running against an in-process fakeredis server instead of a real redis.
+
+    Every layer created with the same server name shares one fake server, so several layers stand in for several
+    Daphne workers connected to the same redis and group fan-out between them behaves like production.
+    Needs ``fakeredis[lua]`` (group_send runs a lua script).
+    """
+    servers = {}
+
+    def __init__(self, server_name="default", **kwargs):
+        super().__init__(**kwargs)
+        self.server_name = server_name
+
+    def create_pool(self, index):
+        from fakeredis import FakeServer
+        from fakeredis.aioredis import FakeConnection
+
+        server = self.servers.setdefault(self.server_name, FakeServer())
+        return ConnectionPool(connection_class=FakeConnection, server=server)
@@ -1,20 +1,53 @@
+import asyncio
 import base64
 import uuid
 
 import filetype
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-
-from chat.models import Message, ChatRoom, MessageReceiver
+from django.db.models import Count
+
+from chat.archive import ArchivedMessageList
+from chat.models import Message, ChatRoom, ReadCursor
+from chat.pagination import SequencePagination
+from chat.serializers import MessageSerializer
+from chat.throttling import RateLimiter, OutboundQueue, OutboundQueueFull
+from chat.uploads import ChunkedUpload, UploadError
+from chat.write_buffer import write_buffer
+from user.presence import presence
 from django.utils.timesince import timesince
 import json
 
 User = get_user_model()
 
 
+# Rate limit budget spent by each type of frame, see CHAT_CONNECTION_RATE_LIMITS.
+FRAME_BUDGETS = {
+    "message": "message",
+    "upload_begin": "message",
+    "typing": "typing",
+    "not-typing": "typing",
+    "mark_as_read": "read",
+    "sync": "sync",
+}
+
+
+def room_group_name(chat_room):
+    return "chat_%s" % chat_room
+
+
+def user_group_name(user_id):
+    return "chat_user_%s" % user_id
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    upload = None
+    outbound = None
+    chat_rooms = ()
 
     async def connect(self):
 
@@ -23,7 +56,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
-        self.room_group_name = "chat_%s" % self.room_name
+        self.room_group_name = room_group_name(self.room_name)
 
         if not await self.is_participant(self.room_name, self.scope["user"]):
             await self.close()
@@ -33,114 +66,234 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        self.chat_rooms = {self.room_name}
+        await self.start()
+        await self.mark_as_read(self.scope["user"], self.room_name)
+
+    async def start(self):
+        self.typing = {}
+        self.limiter = RateLimiter(self.scope["user"].id)
+        self.outbound = OutboundQueue(self.send)
         await self.accept()
-        await self.change_message_status(self.scope["user"], self.room_name)
+        self.outbound.start()
 
     async def disconnect(self, close_code):
-        if hasattr(self, "room_group_name"):
+        if self.outbound is not None:
+            self.outbound.stop()
+        await self.abort_upload()
+        for chat_room in list(getattr(self, "typing", {})):
+            await self.set_typing(chat_room, False)
+        for chat_room in self.chat_rooms:
             await self.channel_layer.group_discard(
-                self.room_group_name,
+                room_group_name(chat_room),
                 self.channel_name
             )
 
+    def frame_room(self, data):
+        """Room a frame is about, None if the connection is not subscribed to it."""
+        return self.room_name
+
     async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            await self.receive_upload_chunk(bytes_data)
+            return
+
         data = json.loads(text_data)
         type = data.get("type")
+        if type in FRAME_BUDGETS:
+            retry_after = self.limiter.throttle(FRAME_BUDGETS[type])
+            if retry_after is not None:
+                # Dropped typing frames are not worth a reply, the next one carries the same state.
+                if FRAME_BUDGETS[type] != "typing":
+                    await self.send(text_data=json.dumps({
+                        "error": "Rate limit exceeded.",
+                        "retry_after": round(retry_after, 2),
+                    }))
+                return
+        if type == "upload_abort":
+            # An upload is not tied to a room until it is committed, the frame names it by the id sent with
+            # upload_ready (any upload in progress when it has none).
+            await self.abort_upload(data.get("upload"))
+            return
+
         username = str(self.scope["user"])
         content = data.get("content")
         file = data.get("file")
-        chat_room = self.room_name
+        chat_room = self.frame_room(data)
+        if chat_room is None:
+            await self.send(text_data=json.dumps({"error": "Unknown chat room."}))
+            return
 
         if type == "message":
-            await self.channel_layer.group_send(
-                self.room_group_name, {
-                    "type": "chat_message",
-                    "content": content,
-                    "file": file,
-                    "username": username,
-                    "chat_room": chat_room,
-                }
-            )
+            if not content and not file:
+                error_message = {"error": "Message should contain either content or a file."}
+                await self.send(text_data=json.dumps(error_message))
+                return
+
+            uploaded_file, file_name = self.decode_base64_and_save_file(file)
+
+            if uploaded_file == file_name == 1:
+                error_message = {"error": "Unsupported file type."}
+                await self.send(text_data=json.dumps(error_message))
+                return
+
+            message = await self.save_message(self.scope["user"], chat_room, content, uploaded_file)
+            await self.set_typing(chat_room, False)
+            await self.broadcast_message(message)
 
         elif type in ["typing", "not-typing"]:
-            await self.channel_layer.group_send(
-                self.room_group_name, {
-                    "type": "writing_active" if type == "typing" else "writing_inactive",
-                    "content": content,
-                    "username": username,
-                    "chat_room": chat_room,
-                }
-            )
+            await self.set_typing(chat_room, type == "typing", content)
 
         if type == "mark_as_read":
+            last_read_id = await self.mark_as_read(self.scope["user"], chat_room)
             await self.channel_layer.group_send(
-                self.room_group_name, {
+                room_group_name(chat_room), {
                     "type": "update_message_status",
                     "username": username,
                     "chat_room": chat_room,
-                    "is_seen": True,
+                    "text": json.dumps({
+                        "username": username,
+                        "chat_room": chat_room,
+                        "is_seen": True,
+                        "last_read_id": last_read_id,
+                    }),
                 }
             )
 
-    async def update_message_status(self, event):
-        # print("content status", event)
-        username = event["username"]
-        chat_room = event["chat_room"]
-        is_seen = await self.change_message_status(username, chat_room)
-        await self.send(text_data=json.dumps({
-            "username": username,
+        elif type == "upload_begin":
+            await self.begin_upload(data)
+
+        elif type == "upload_commit":
+            await self.commit_upload(chat_room, content)
+
+        elif type == "sync":
+            try:
+                paginator = SequencePagination(data.get("after"), data.get("before"), data.get("limit"))
+            except ValueError as e:
+                await self.send(text_data=json.dumps({"error": str(e)}))
+                return
+            messages, has_more = await self.sync_messages(self.scope["user"], chat_room, paginator)
+            await self.send(text_data=json.dumps({
+                "type": "sync",
+                "chat_room": chat_room,
+                "messages": messages,
+                "has_more": has_more,
+            }))
+
+    async def broadcast_message(self, message):
+        # The sender persists the message once and fans out the final payload,
+        # receivers only forward it to their socket.
+        await self.channel_layer.group_send(
+            room_group_name(message["chat_room"]), {
+                "type": "chat_message",
+                "text": json.dumps(message),
+            }
+        )
+
+    async def set_typing(self, chat_room, typing, content=None):
+        # Typing frames only reach the room when this user's state changes. Repeated "typing" frames just push
+        # back the timeout after which the user is reported as not typing anymore.
+        is_typing = chat_room in self.typing
+        timeout = self.typing.pop(chat_room, None)
+        if timeout is not None:
+            timeout.cancel()
+        if typing:
+            self.typing[chat_room] = asyncio.create_task(self.expire_typing(chat_room))
+
+        if typing == is_typing:
+            return
+
+        user = self.scope["user"]
+        payload = {
+            "type": "writing_active" if typing else "writing_inactive",
+            "content": content,
+            "username": user.username,
             "chat_room": chat_room,
-            "is_seen": is_seen,
+        }
+        if typing:
+            payload["first_name"] = user.first_name
+            payload["last_name"] = user.last_name
+        await self.channel_layer.group_send(
+            room_group_name(chat_room), {
+                "type": payload["type"],
+                "username": user.username,
+                "chat_room": chat_room,
+                "text": json.dumps(payload),
+            }
+        )
+
+    async def expire_typing(self, chat_room):
+        await asyncio.sleep(settings.CHAT_TYPING_TIMEOUT)
+        # Still typing as far as the room knows, but there is no timeout left to cancel.
+        self.typing[chat_room] = None
+        await self.set_typing(chat_room, False)
+
+    async def begin_upload(self, data):
+        await self.abort_upload()
+        try:
+            self.upload = ChunkedUpload(data.get("name"), data.get("size"), data.get("hash"))
+        except UploadError as e:
+            await self.send(text_data=json.dumps({"error": str(e)}))
+            return
+        await self.send(text_data=json.dumps({
+            "type": "upload_ready",
+            "upload": self.upload.id,
+            "chunk_size": settings.CHAT_UPLOAD_CHUNK_SIZE,
         }))
 
-    async def chat_message(self, event):
-        # print("chat_message", event)
-        username = event["username"]
-        chat_room = event["chat_room"]
-        content = event["content"]
-        file_data = event["file"]
+    async def receive_upload_chunk(self, chunk):
+        if self.upload is None:
+            await self.send(text_data=json.dumps({"error": "No upload in progress."}))
+            return
+        try:
+            await sync_to_async(self.upload.write, thread_sensitive=False)(chunk)
+        except UploadError as e:
+            await self.abort_upload()
+            await self.send(text_data=json.dumps({"error": str(e)}))
+
+    async def commit_upload(self, chat_room, content):
+        upload, self.upload = self.upload, None
+        if upload is None:
+            await self.send(text_data=json.dumps({"error": "No upload in progress."}))
+            return
+        try:
+            file = await sync_to_async(upload.commit, thread_sensitive=False)()
+            message = await self.save_message(self.scope["user"], chat_room, content, file)
+        except UploadError as e:
+            await self.send(text_data=json.dumps({"error": str(e)}))
+            return
+        finally:
+            await sync_to_async(upload.close, thread_sensitive=False)()
+        await self.broadcast_message(message)
 
-        if not content and not file_data:
-            error_message = {"error": "Message should contain either content or a file."}
-            await self.send(text_data=json.dumps(error_message))
-            return {"error": error_message}
+    async def abort_upload(self, upload_id=None):
+        if upload_id is not None and (self.upload is None or self.upload.id != upload_id):
+            return
+        upload, self.upload = self.upload, None
+        if upload is not None:
+            await sync_to_async(upload.close, thread_sensitive=False)()
 
-        first_name, last_name = await self.get_first_name_and_last_name(username)
-        participants_count = await self.get_participants_count(chat_room)
-        receivers = await self.get_receivers(chat_room, username)
+    async def push(self, text, key=None):
+        try:
+            self.outbound.put(text, key)
+        except OutboundQueueFull:
+            # The client cannot keep up, it resyncs from its last sequence when it reconnects.
+            await self.close(code=4008)
 
-        uploaded_file, file_name = self.decode_base64_and_save_file(file_data)
+    async def update_message_status(self, event):
+        await self.push(event["text"], key=("status", event.get("chat_room"), event.get("username")))
 
-        if uploaded_file == file_name == 1:
-            error_message = {"error": "Unsupported file type."}
-            await self.send(text_data=json.dumps(error_message))
-            return {"error": error_message}
+    async def chat_message(self, event):
+        await self.push(event["text"])
 
-        new_message = await self.save_message(username, chat_room, receivers, content, uploaded_file)
-
-        await self.send(text_data=json.dumps({
-            **event,
-            "participants": participants_count,
-            "first_name": first_name,
-            "last_name": last_name,
-            "timestamp": timesince(new_message.timestamp),
-        }))
+    async def message_thumbnails(self, event):
+        await self.push(event["text"], key=("thumbnails", event.get("chat_room"), event.get("id")))
 
     async def writing_active(self, event):
-        # print("active", event)
-        username = event["username"]
-        first_name, last_name = await self.get_first_name_and_last_name(username)
-        await self.send(text_data=json.dumps({
-            **event,
-            "first_name": first_name,
-            "last_name": last_name,
-        }))
+        await self.push(event["text"], key=("typing", event.get("chat_room"), event.get("username")))
 
     async def writing_inactive(self, event):
-        # print("inactive", event)
-        await self.send(text_data=json.dumps({
-            **event,
-        }))
+        await self.push(event["text"], key=("typing", event.get("chat_room"), event.get("username")))
 
     @staticmethod
     def decode_base64_and_save_file(file_data):
@@ -148,12 +301,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return None, None
 
         file = base64.b64decode(file_data)
-        kind = filetype.guess_extension(file)
+        kind = filetype.guess(file)
 
         if not kind:
             return 1, 1
 
-        file_extension = f".{kind}" if kind else ".bin"
+        file_extension = f".{kind.extension}" if kind else ".bin"
         file_name = f"{str(uuid.uuid4())}{file_extension}"
 
         uploaded_file = SimpleUploadedFile(file_name, file,
@@ -165,40 +318,126 @@ class ChatConsumer(AsyncWebsocketConsumer):
         chatroom = ChatRoom.objects.get(slug=chat_room)
         return ((user in chatroom.participants.all()) or user.is_admin) and chatroom.status == "active"
 
+    async def save_message(self, user, chat_room, content=None, file=None):
+        # Text messages go through the group commit buffer when enabled, attachments are always saved on their own.
+        if settings.CHAT_WRITE_BUFFER and file is None:
+            new_message, chat_room = await write_buffer.save(user, chat_room, content)
+        else:
+            new_message, chat_room = await self.create_message(user, chat_room, content, file)
+        return {
+            "type": "chat_message",
+            "id": new_message.id,
+            "sequence": new_message.sequence,
+            "content": content,
+            "file": new_message.file.url if new_message.file else None,
+            "thumbnails": new_message.thumbnail_urls(),
+            "username": user.username,
+            "chat_room": chat_room.slug,
+            "participants": chat_room.participants_count,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "timestamp": timesince(new_message.timestamp),
+        }
+
     @database_sync_to_async
-    def save_message(self, username, chat_room, receivers, content=None, file=None):
-        user = User.objects.get(username=username)
-        chat_room = ChatRoom.objects.get(slug=chat_room)
+    def create_message(self, user, chat_room, content=None, file=None):
+        chat_room = ChatRoom.objects.annotate(participants_count=Count("participants")).get(slug=chat_room)
         new_message = Message.objects.create(chat_room=chat_room, sender=user, content=content, file=file)
-        receiver_users = User.objects.filter(username__in=receivers)
-        for receiver in receiver_users:
-            MessageReceiver.objects.create(message=new_message, receiver=receiver, is_seen=False)
-        return new_message
+        return new_message, chat_room
 
     @database_sync_to_async
-    def get_first_name_and_last_name(self, username):
-        user = User.objects.get(username=username)
-        return user.first_name, user.last_name
+    def mark_as_read(self, user, chat_room):
+        chat_room = ChatRoom.objects.get(slug=chat_room)
+        if not chat_room.participants.filter(pk=user.pk).exists():
+            return None
+        return ReadCursor.mark_read(chat_room, user)
 
     @database_sync_to_async
-    def get_participants_count(self, room_name):
-        room_instance = ChatRoom.objects.get(slug=room_name)
-        return room_instance.participants.count()
+    def sync_messages(self, user, chat_room, paginator):
+        chat_room = ChatRoom.objects.get(slug=chat_room)
+        messages = chat_room.visible_messages(user).prefetch_related("sender")
+        if chat_room.archived_at:
+            messages = ArchivedMessageList(chat_room, messages, since=chat_room.visible_since(user))
+            messages, has_more = messages.paginate_sequence(paginator)
+        else:
+            messages, has_more = paginator.paginate(messages)
+        serializer = MessageSerializer(messages, many=True, context={"read_cursors": ReadCursor.room_cursors(chat_room)})
+        return serializer.data, has_more
 
-    @database_sync_to_async
-    def get_receivers(self, room_name, username):
-        user = User.objects.get(username=username)
-        room_instance = ChatRoom.objects.get(slug=room_name)
-        receivers = room_instance.participants.exclude(username=user)
-        usernames = [receiver.username for receiver in receivers]
-        return usernames
+
+class UserChatConsumer(ChatConsumer):
+    """
+    One websocket for all the active chat rooms of the user.
+
+    The rooms are looked up with a single query when connecting, every frame names its room in "chat_room" (but
+    upload_abort, which names its upload) and every event sent to the client carries it. Rooms the user joins while connected are added through the
+    user's own group, and removed when the user leaves them or they are closed (see chat.signals).
+    """
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        self.chat_rooms = set(await self.get_chat_rooms(user))
+        self.user_group_name = user_group_name(user.id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        for chat_room in self.chat_rooms:
+            await self.channel_layer.group_add(room_group_name(chat_room), self.channel_name)
+        await self.start()
+        await self.send(text_data=json.dumps({
+            "type": "subscribed",
+            "chat_rooms": sorted(self.chat_rooms),
+        }))
+
+    async def disconnect(self, close_code):
+        await super().disconnect(close_code)
+        if hasattr(self, "user_group_name"):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+
+    def frame_room(self, data):
+        chat_room = data.get("chat_room")
+        return chat_room if chat_room in self.chat_rooms else None
+
+    async def chat_room_joined(self, event):
+        chat_room = event["chat_room"]
+        if chat_room not in self.chat_rooms:
+            self.chat_rooms.add(chat_room)
+            await self.channel_layer.group_add(room_group_name(chat_room), self.channel_name)
+        await self.push(json.dumps({"type": "subscribed", "chat_rooms": [chat_room]}))
+
+    async def chat_room_left(self, event):
+        chat_room = event["chat_room"]
+        if chat_room not in self.chat_rooms:
+            return
+        self.chat_rooms.discard(chat_room)
+        await self.channel_layer.group_discard(room_group_name(chat_room), self.channel_name)
+        await self.set_typing(chat_room, False)
+        await self.push(json.dumps({"type": "unsubscribed", "chat_rooms": [chat_room]}))
 
     @database_sync_to_async
-    def change_message_status(self, username, chat_room):
-        user = User.objects.get(username=username)
-        room_name = ChatRoom.objects.get(slug=chat_room)
-        if user in room_name.participants.all():
-            message_receivers = MessageReceiver.objects.filter(message__chat_room=room_name, receiver=user)
-            for message_receiver in message_receivers:
-                message_receiver.is_seen = True
-                message_receiver.save()
+    def get_chat_rooms(self, user):
+        return list(ChatRoom.objects.filter(participants=user, status="active").values_list("slug", flat=True))
+
+
+class OnlineStatus(AsyncWebsocketConsumer):
+
+    async def connect(self):
+        if not self.scope["user"].is_authenticated:
+            await self.close()
+            return
+
+        await self.accept()
+        presence.connect(self.scope["user"].id, self.channel_name)
+        await self.send(text_data=json.dumps({
+            "type": "heartbeat",
+            "interval": settings.PRESENCE_HEARTBEAT_INTERVAL,
+        }))
+
+    async def disconnect(self, close_code):
+        if self.scope["user"].is_authenticated:
+            presence.disconnect(self.scope["user"].id, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        presence.heartbeat(self.scope["user"].id, self.channel_name)
@@ -1,4 +1,7 @@
-import traceback
+import asyncio
+import threading
+import time
+from collections import OrderedDict
 from urllib.parse import parse_qs
 
 from channels.auth import AuthMiddlewareStack
@@ -6,32 +9,108 @@ from channels.db import database_sync_to_async
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from django.db import close_old_connections
+from django.db.models.signals import post_save, post_delete
 from jwt import decode as jwt_decode
-from jwt import InvalidSignatureError, ExpiredSignatureError, DecodeError
+from jwt import InvalidTokenError
 
 User = get_user_model()
 
+# In model field order, as Model.from_db expects.
+SNAPSHOT_FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname in {
+    "id", "username", "email", "first_name", "last_name", "slug", "is_active", "is_admin", "is_superuser"}]
+
+
+class UserCache:
+    """
+    Bounded LRU of user id -> snapshot of the fields the websocket consumers use, expiring after a TTL.
+
+    Every handshake gets its own User instance built from the snapshot (other fields are deferred), so a burst of
+    reconnects costs one query per user instead of one per socket. Concurrent misses for the same user wait for the
+    same query. Saves and deletes in this process invalidate the entry, the TTL bounds staleness for changes made
+    by other processes.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return self.build(entry[1])
+
+        if user_id not in self.pending:
+            self.pending[user_id] = asyncio.ensure_future(self.load(user_id))
+        snapshot = await asyncio.shield(self.pending[user_id])
+        return self.build(snapshot) if snapshot is not None else AnonymousUser()
+
+    async def load(self, user_id):
+        try:
+            generation = self.generation
+            snapshot = await self.fetch(user_id)
+            self.misses += 1
+            with self.lock:
+                # Do not store a snapshot read before an invalidation that happened while it was being fetched.
+                if snapshot is not None and generation == self.generation:
+                    self.entries[user_id] = (time.monotonic() + self.ttl, snapshot)
+                    self.entries.move_to_end(user_id)
+                    while len(self.entries) > self.max_size:
+                        self.entries.popitem(last=False)
+            return snapshot
+        finally:
+            self.pending.pop(user_id, None)
+
+    @staticmethod
+    @database_sync_to_async
+    def fetch(user_id):
+        values = User.objects.filter(id=user_id).values_list(*SNAPSHOT_FIELDS).first()
+        if values is None:
+            return None
+        return User._meta.default_manager.db, values
+
+    @staticmethod
+    def build(snapshot):
+        db, values = snapshot
+        return User.from_db(db, SNAPSHOT_FIELDS, values)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+user_cache = UserCache(settings.JWT_USER_CACHE_SIZE, settings.JWT_USER_CACHE_TTL)
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+post_save.connect(invalidate_cached_user, sender=User)
+post_delete.connect(invalidate_cached_user, sender=User)
+
 
 class JWTAuthMiddleware:
     def __init__(self, app):
         self.app = app
 
     async def __call__(self, scope, receive, send):
-        close_old_connections()
-        try:
-            if jwt_token_list := parse_qs(scope["query_string"].decode("utf8")).get("token", None):
-                jwt_token = jwt_token_list[0]
-                jwt_payload = self.get_payload(jwt_token)
-                user_credentials = self.get_user_credentials(jwt_payload)
-                user = await self.get_logged_in_user(user_credentials)
-                scope["user"] = user
-            else:
-                scope["user"] = AnonymousUser()
-        except (InvalidSignatureError, KeyError, ExpiredSignatureError, DecodeError):
-            traceback.print_exc()
-        except:
-            scope["user"] = AnonymousUser()
+        # Database access goes through database_sync_to_async, which closes stale connections itself.
+        scope["user"] = await self.get_logged_in_user(scope)
         return await self.app(scope, receive, send)
 
     def get_payload(self, jwt_token):
@@ -47,16 +126,19 @@ class JWTAuthMiddleware:
         user_id = payload["user_id"]
         return user_id
 
-    async def get_logged_in_user(self, user_id):
-        user = await self.get_user(user_id)
-        return user
-
-    @database_sync_to_async
-    def get_user(self, user_id):
+    async def get_logged_in_user(self, scope):
+        jwt_token_list = parse_qs(scope["query_string"].decode("utf8")).get("token", None)
+        if not jwt_token_list:
+            return AnonymousUser()
         try:
-            return User.objects.get(id=user_id)
-        except User.DoesNotExist:
+            jwt_payload = self.get_payload(jwt_token_list[0])
+            user_id = int(self.get_user_credentials(jwt_payload))
+        except (InvalidTokenError, KeyError, TypeError, ValueError):
             return AnonymousUser()
+        return await self.get_user(user_id)
+
+    async def get_user(self, user_id):
+        return await user_cache.get(user_id)
 
 
 def JWTAuthMiddlewareStack(app):
@@ -2,6 +2,7 @@ from django.urls import path
 from djangofls import consumers
 
 websocket_urlpatterns = [
+    path('ws/user/online/', consumers.OnlineStatus.as_asgi()),
+    path('ws/user/chats/', consumers.UserChatConsumer.as_asgi()),
     path('ws/<str:room_name>/', consumers.ChatConsumer.as_asgi()),
-    # path('ws/user/online/', consumers.OnlineStatus.as_asgi()),
 ]
\ No newline at end of file
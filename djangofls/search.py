@@ -0,0 +1,36 @@
+import re
+
+from django.db import router
+
+# Query helpers shared by the full-text search backends of the apps (chat.search, project.search), and the migration
+# helper creating their indexes.
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_terms(query):
+    """The words of a user query, everything else (quotes, operators) is dropped."""
+    return TOKEN_RE.findall(query or "")
+
+
+def fts5_match(terms):
+    """
+    FTS5 query matching every term, the last one as a prefix so results show up while the user is typing. Every term
+    is quoted so user input is never parsed as FTS5 syntax.
+    """
+    return " ".join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+def run_for_vendor(model, statements):
+    """
+    RunPython code executing the statements of the database vendor, on the databases where model ("app.Model") is
+    migrated. Migrations keep importing it from here, it must not change once they are applied.
+    """
+    def run(apps, schema_editor):
+        connection = schema_editor.connection
+        migrated = router.allow_migrate_model(connection.alias, apps.get_model(model))
+        if connection.vendor not in statements or not migrated:
+            return
+        for statement in statements[connection.vendor]:
+            schema_editor.execute(statement)
+
+    return run
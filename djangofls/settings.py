@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     "education.apps.EducationConfig",
     "location.apps.LocationConfig",
     "chat.apps.ChatConfig",
+    "filestore.apps.FilestoreConfig",
 
     "daphne",
 
@@ -72,19 +73,160 @@ TEMPLATES = [
 WSGI_APPLICATION = "djangofls.wsgi.application"
 
 ASGI_APPLICATION = "djangofls.asgi.application"
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+
+# "memory" only works with a single Daphne process, "redis" is needed to run several workers and
+# "fakeredis" runs the redis layer against an in-process server for tests.
+CHANNEL_LAYER_BACKEND = os.environ.get("CHANNEL_LAYER_BACKEND", "memory")
+CHANNEL_REDIS_URL = os.environ.get("CHANNEL_REDIS_URL", "redis://redis:6379/1")
+
+CHANNEL_REDIS_CONFIG = {
+    # One connection pool per event loop, capped so a worker cannot exhaust redis connections.
+    "hosts": [{
+        "address": CHANNEL_REDIS_URL,
+        "max_connections": int(os.environ.get("CHANNEL_REDIS_MAX_CONNECTIONS", 50)),
+    }],
+    "prefix": "djangofls",
+    # Seconds an undelivered message waits in a channel before it is dropped.
+    "expiry": 30,
+    # Seconds before a group membership expires, sockets are closed by then or rejoin on reconnect.
+    "group_expiry": 60 * 60 * 6,
+    # Queue size per channel, past it sends raise ChannelFull and group sends to the slow channel are dropped.
+    "capacity": 200,
+    "channel_capacity": {
+        # Consumer inboxes, a socket that falls this far behind stops receiving room broadcasts.
+        "specific.*": 100,
+    },
+}
+
+if CHANNEL_LAYER_BACKEND == "redis":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": CHANNEL_REDIS_CONFIG,
+        }
+    }
+elif CHANNEL_LAYER_BACKEND == "fakeredis":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "djangofls.channel_layers.FakeRedisChannelLayer",
+            "CONFIG": {key: value for key, value in CHANNEL_REDIS_CONFIG.items() if key != "hosts"},
+        }
     }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+
+# Attachments sent over the chat websocket in binary chunks.
+CHAT_UPLOAD_MAX_SIZE = int(os.environ.get("CHAT_UPLOAD_MAX_SIZE", 25 * 1024 * 1024))
+CHAT_UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# WebP thumbnails made in the background for image attachments, by name and longest side in pixels.
+CHAT_THUMBNAIL_SIZES = {"small": 160, "medium": 640}
+CHAT_THUMBNAIL_QUALITY = 80
+
+# Seconds without a "typing" frame before the user is reported as not typing.
+CHAT_TYPING_TIMEOUT = 5
+
+# Token buckets (frames per second, burst) limiting the frames a chat websocket may send, per connection and per
+# user across all its connections on a worker. Frames waiting for the consumer to hand them to Daphne are bounded
+# by CHAT_OUTBOUND_QUEUE_SIZE, only typing and read status updates are dropped (see chat.throttling.OutboundQueue).
+CHAT_CONNECTION_RATE_LIMITS = {
+    "message": (1, 10),
+    "typing": (2, 10),
+    "read": (2, 10),
+    "sync": (2, 10),
+}
+CHAT_USER_RATE_LIMITS = {
+    "message": (2, 20),
+    "typing": (4, 20),
+    "read": (4, 20),
+    "sync": (4, 20),
 }
+CHAT_OUTBOUND_QUEUE_SIZE = 100
+
+# Group commit of the text messages sent over the websockets: when enabled they are saved in one transaction per
+# CHAT_WRITE_BUFFER_DELAY seconds or CHAT_WRITE_BUFFER_SIZE messages, see chat.write_buffer.
+CHAT_WRITE_BUFFER = os.environ.get("CHAT_WRITE_BUFFER", "0") == "1"
+CHAT_WRITE_BUFFER_DELAY = 0.005
+CHAT_WRITE_BUFFER_SIZE = 100
+
+# Closed rooms untouched for CHAT_ARCHIVE_AFTER_DAYS have their messages moved to gzipped JSONL files under
+# CHAT_ARCHIVE_ROOT, see chat.archive.
+CHAT_ARCHIVE_ROOT = os.environ.get("CHAT_ARCHIVE_ROOT", os.path.join(BASE_DIR, "chat_archive"))
+CHAT_ARCHIVE_AFTER_DAYS = 30
+
+# Cached ProjectViewSet list and retrieve responses and project recommendations, see project.cache. Invalidations are
+# version bumps in the cache, only "redis" shares them between processes atomically and must be used whenever more
+# than one process serves requests (docker-compose does). "locmem", the default, and "file" are for a single process
+# (e.g. runserver): locmem is per process, and the file backend's incr() is not atomic, concurrent bumps can be lost.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+if CACHE_BACKEND == "redis":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("CACHE_REDIS_URL", "redis://redis:6379/2"),
+        }
+    }
+elif CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", os.path.join(BASE_DIR, "cache")),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+PROJECT_CACHE_TIMEOUT = int(os.environ.get("PROJECT_CACHE_TIMEOUT", 300))
+
+# "page" keeps page numbers on the project and proposal lists for existing clients, "cursor" switches them to keyset
+# pages. Either way a request asks for one or the other with the "page" or "cursor" parameter, see
+# project.pagination.
+PROJECT_PAGINATION = os.environ.get("PROJECT_PAGINATION", "page")
+
+# Projects recommended to freelancers, see project.recommendations: weights of the skill overlap, the fit with the
+# prices they proposed before and the age of the project (halved every RECOMMENDATION_RECENCY_HALF_LIFE seconds).
+RECOMMENDATION_WEIGHTS = {"skills": 0.6, "price": 0.2, "recency": 0.2}
+RECOMMENDATION_RECENCY_HALF_LIFE = 7 * 24 * 3600
+RECOMMENDATION_LIMIT = 100
+RECOMMENDATION_SYNC_INTERVAL = 5
+# Projects modified up to RECOMMENDATION_SYNC_OVERLAP seconds before the last sync are read again, in case their
+# transaction committed after it.
+RECOMMENDATION_SYNC_OVERLAP = 60
+RECOMMENDATION_REBUILD_INTERVAL = 3600
+RECOMMENDATION_CACHE_TTL = 600
+
+# Presence websocket: clients heartbeat every PRESENCE_HEARTBEAT_INTERVAL seconds, a connection without heartbeat for
+# PRESENCE_TTL seconds is considered gone and User.is_online is written in batches every PRESENCE_FLUSH_INTERVAL.
+PRESENCE_HEARTBEAT_INTERVAL = 30
+PRESENCE_TTL = 75
+PRESENCE_FLUSH_INTERVAL = 10
 
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    "chat": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get("CHAT_DATABASE_NAME", BASE_DIR / "chat.sqlite3"),
+    },
 }
 
+# Messages, message receivers and read cursors are stored in the CHAT_DATABASE alias so chat traffic does not queue
+# the writes of the default database, see chat.routers. Set CHAT_DATABASE=default to keep a single database. A new
+# chat database is created with "manage.py migrate --database chat", tests need databases = {"default", "chat"}.
+CHAT_DATABASE = os.environ.get("CHAT_DATABASE", "chat")
+DATABASE_ROUTERS = ["chat.routers.ChatRouter"]
+
 # DATABASES = {
 #     "default": {
 #         # "ENGINE": "django.db.backends.postgresql",
@@ -128,6 +270,16 @@ STATIC_URL = "static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 
+# Uploads are deduplicated by content, see filestore.storage.
+STORAGES = {
+    "default": {
+        "BACKEND": "filestore.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "user.User"
@@ -168,8 +320,17 @@ SIMPLE_JWT = {
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
 }
 
+# Websocket handshakes resolve the token's user through an in-process LRU of JWT_USER_CACHE_SIZE users, entries
+# expire after JWT_USER_CACHE_TTL seconds.
+JWT_USER_CACHE_SIZE = 10000
+JWT_USER_CACHE_TTL = 60
+
 # SITE_ID = 1
 
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BACKEND", "redis://redis:6379/0")
+# Without timeouts a broker that accepts connections but never answers blocks the publishing thread forever.
+CELERY_BROKER_TRANSPORT_OPTIONS = {"socket_timeout": 5, "socket_connect_timeout": 5}
+# Runs the tasks in the calling process, for development without a broker.
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", "0") == "1"
 
@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from rest_framework import routers
 from django.apps import apps
 
+from filestore.views import serve
 from user.authentication import FirstStepTokenView, SecondStepTokenView
 
 main_router = routers.DefaultRouter()
@@ -41,4 +42,4 @@ urlpatterns = [
 ]
 
 urlpatterns += [
-               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+               ] + static(settings.MEDIA_URL, view=serve)
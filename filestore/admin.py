@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from filestore.models import Blob, StoredFile
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("id", "sha256", "size", "ref_count", "created")
+
+
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "blob", "created")
+    raw_id_fields = ("blob",)
@@ -0,0 +1,56 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from filestore.models import Blob, StoredFile
+from filestore.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = "Moves the files written before the content addressed storage into it, keeping one copy per content"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the space that would be saved")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not filestore.storage.ContentAddressedStorage.")
+
+        root = default_storage.location
+        seen = set()
+        files = saved = 0
+        for directory, dirnames, filenames in os.walk(root):
+            if directory == root and "blobs" in dirnames:
+                dirnames.remove("blobs")
+            for filename in filenames:
+                file_path = os.path.join(directory, filename)
+                name = os.path.relpath(file_path, root).replace(os.sep, "/")
+                if StoredFile.objects.filter(name=name).exists():
+                    continue
+
+                sha256, size = self.hash_file(file_path)
+                files += 1
+                if sha256 in seen or Blob.objects.filter(sha256=sha256).exists():
+                    saved += size
+                seen.add(sha256)
+                if not options["dry_run"]:
+                    default_storage.add_name(name, sha256, size, file_path)
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+
+        if options["dry_run"]:
+            self.stdout.write(f"{files} files would be moved to the file store, saving {saved} bytes.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{files} files moved to the file store, saved {saved} bytes."))
+
+    @staticmethod
+    def hash_file(file_path):
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
@@ -0,0 +1,33 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name=_("SHA-256"))
+    size = models.PositiveBigIntegerField(verbose_name=_("Size"))
+    ref_count = models.PositiveIntegerField(default=0, verbose_name=_("Reference Count"))
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+    @property
+    def path(self):
+        return f"blobs/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}"
+
+    class Meta:
+        verbose_name = _("Blob")
+        verbose_name_plural = _("Blobs")
+
+
+class StoredFile(models.Model):
+    name = models.CharField(max_length=500, unique=True, verbose_name=_("Name"))
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name="files")
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = _("Stored File")
+        verbose_name_plural = _("Stored Files")
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils._os import safe_join
+
+from filestore.models import Blob, StoredFile
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage keeping a single copy of every distinct file content.
+
+    Files are written once under blobs/<aa>/<bb>/<sha256> and the names chosen by the FileFields' upload_to
+    (which are still the names saved in the database and used in the URLs) are mapped to their blob by StoredFile.
+    Blob.ref_count counts the names pointing at a blob, the blob is removed with its last name.
+    Names without a mapping are files written before this storage and are read from their own path.
+    """
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        size = 0
+        tmp_dir = os.path.join(self.location, "blobs", "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        if hasattr(content, "seek") and content.seekable():
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+                tmp.write(chunk)
+
+        try:
+            self.add_name(name, digest.hexdigest(), size, tmp.name)
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+        return name
+
+    def add_name(self, name, sha256, size, source):
+        """Maps name to the blob of the given content, moving source into place if the blob is new."""
+        with transaction.atomic():
+            blob, created = Blob.objects.get_or_create(sha256=sha256, defaults={"size": size})
+            blob = Blob.objects.select_for_update().get(pk=blob.pk)
+            blob_path = os.path.join(self.location, blob.path)
+            if created or not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(source, blob_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(blob_path, self.file_permissions_mode)
+            StoredFile.objects.create(name=name, blob=blob)
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1)
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            stored_file = StoredFile.objects.filter(name=name).select_related("blob").first()
+            if stored_file is None:
+                return super().delete(name)
+
+            blob = Blob.objects.select_for_update().get(pk=stored_file.blob_id)
+            stored_file.delete()
+            if blob.ref_count > 1:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") - 1)
+                return
+            blob.delete()
+            transaction.on_commit(lambda: self.remove_blob(blob))
+
+    def remove_blob(self, blob):
+        # The same content may have been saved again since the blob was deleted.
+        if Blob.objects.filter(sha256=blob.sha256).exists():
+            return
+        try:
+            os.remove(os.path.join(self.location, blob.path))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, name):
+        return StoredFile.objects.filter(name=name).exists() or super().exists(name)
+
+    def path(self, name):
+        sha256 = StoredFile.objects.filter(name=name).values_list("blob__sha256", flat=True).first()
+        if sha256 is None:
+            return super().path(name)
+        return safe_join(self.location, Blob(sha256=sha256).path)
+
+    def _open(self, name, mode="rb"):
+        return File(open(self.path(name), mode), name=name)
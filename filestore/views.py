@@ -0,0 +1,17 @@
+import mimetypes
+
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+
+
+def serve(request, path):
+    """Development counterpart of django.views.static.serve resolving names through the storage."""
+    try:
+        file = default_storage.open(path)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404
+    content_type, encoding = mimetypes.guess_type(path)
+    response = FileResponse(file, content_type=content_type or "application/octet-stream")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
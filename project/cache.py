@@ -0,0 +1,75 @@
+import hashlib
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+FEED_VERSION_KEY = "project_cache:feed"
+PROJECT_VERSION_KEY = "project_cache:project:%s"
+RESPONSE_KEY = "project_cache:%s:%s:%s"
+
+# Process wide hit and miss counters of the cached project responses, served by ProjectCacheMetricsView.
+metrics = Counter()
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Missing or evicted, restarting from the clock never reuses a version whose responses may still be cached.
+        cache.set(key, time.time_ns(), None)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_projects(project_ids):
+    """Forgets the cached detail of the projects and every cached page of the feed."""
+    for project_id in project_ids:
+        bump_version(PROJECT_VERSION_KEY % project_id)
+    bump_version(FEED_VERSION_KEY)
+
+
+def response_key(kind, version, request, per_user=False):
+    # The serialized projects hold absolute URLs, the host is part of the key along with the query parameters.
+    url = request.build_absolute_uri(request.path) + "?" + urlencode(sorted(request.query_params.lists()), doseq=True)
+    if per_user:
+        url += f"#user={request.user.pk}"
+    return RESPONSE_KEY % (kind, version, hashlib.sha1(url.encode()).hexdigest())
+
+
+def cached_response_data(kind, version_key, request, render, per_user=False):
+    """
+    The response data cached under the current version of version_key for the request, or render()'s data that is
+    then cached for PROJECT_CACHE_TIMEOUT seconds. Responses that depend on the user are cached per_user. Returns
+    (data, hit), render() may raise (e.g. Http404) and nothing is cached then.
+    """
+    key = response_key(kind, get_version(version_key), request, per_user)
+    data = cache.get(key)
+    if data is not None:
+        metrics[f"{kind}.hit"] += 1
+        return data, True
+
+    metrics[f"{kind}.miss"] += 1
+    data = render()
+    cache.set(key, data, settings.PROJECT_CACHE_TIMEOUT)
+    return data, False
+
+
+def hit_rates():
+    stats = {}
+    for kind in ["list", "detail"]:
+        hits, misses = metrics[f"{kind}.hit"], metrics[f"{kind}.miss"]
+        stats[kind] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
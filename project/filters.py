@@ -0,0 +1,27 @@
+from rest_framework import filters
+
+from djangofls.search import search_terms
+from project.search import get_project_search_backend
+
+
+class ProjectSearchFilter(filters.SearchFilter):
+    """
+    Ranked search of the projects through their full-text index (see project.search), results are ordered by
+    relevance unless the request gives an ordering. Falls back to the search_fields lookups of SearchFilter on
+    databases without a search backend.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        backend = get_project_search_backend()
+        if not getattr(view, "search_fields", None):
+            return queryset
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        terms = search_terms(request.query_params.get(self.search_param))
+        if not terms:
+            return queryset
+        queryset = backend.filter(queryset, terms)
+        if "ordering" not in request.query_params:
+            queryset = queryset.order_by("search_rank", "-created")
+        return queryset
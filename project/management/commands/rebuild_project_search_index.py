@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from project.search import get_project_search_backend
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the full-text index of the projects, needed after projects or skills were changed with "
+            "queryset update() or bulk operations that send no signals")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = get_project_search_backend()
+        if backend is None:
+            raise CommandError("The project database has no full-text search backend.")
+        backend.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Project search index rebuilt successfully"))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:19
+
+from django.db import migrations
+
+from djangofls.search import run_for_vendor
+
+SQLITE_CREATE = [
+    # Standalone table keyed by the project id: the skill names are not columns of project_project.
+    """
+    CREATE VIRTUAL TABLE project_project_fts USING fts5(
+        title, description, additional_notes, skills, tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO project_project_fts(rowid, title, description, additional_notes, skills)
+    SELECT p.id, p.title, p.description, p.additional_notes, COALESCE((
+        SELECT group_concat(s.name, ' ') FROM project_project_skill_needed ps
+        JOIN education_skill s ON s.id = ps.skill_id WHERE ps.project_id = p.id
+    ), '')
+    FROM project_project p
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TABLE IF EXISTS project_project_fts",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0002_remove_skill_description_alter_degree_name_and_more'),
+        ('project', '0066_remove_chosenproposal_selected_proposal_d'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor("project.Project", {"sqlite": SQLITE_CREATE}),
+            run_for_vendor("project.Project", {"sqlite": SQLITE_DROP}),
+        ),
+    ]
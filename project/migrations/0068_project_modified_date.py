@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0067_project_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='modified_date',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Modified Date'),
+        ),
+    ]
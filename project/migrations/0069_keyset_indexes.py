@@ -0,0 +1,33 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0068_project_modified_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chosenproposal',
+            index=models.Index(fields=['-chosen_date', '-id'], name='chosen_proposal_date'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', '-created', '-id'], name='project_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['published_user', 'status', '-created', '-id'], name='project_user_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='projectproposal',
+            index=models.Index(fields=['proposer', '-proposal_date', '-id'], name='proposal_proposer_date'),
+        ),
+        migrations.AddIndex(
+            model_name='projectproposal',
+            index=models.Index(fields=['project', '-proposal_date', '-id'], name='proposal_project_date'),
+        ),
+    ]
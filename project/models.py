@@ -35,16 +35,29 @@ class Project(models.Model):
     proposal_time_end = models.DateField(blank=False, null=False, verbose_name=_("Proposal Time End"))
     created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="active", verbose_name=_("Project Status"))
+    # Also bumped when the skills change, project.recommendations re-reads the projects modified since its last sync.
+    modified_date = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_("Modified Date"))
 
     class Meta:
         verbose_name = _("Project")
         verbose_name_plural = _("Projects")
+        # Keyset pagination of the feed and of the owner's lists, see project.pagination.
+        indexes = [
+            models.Index(fields=["status", "-created", "-id"], name="project_status_created"),
+            models.Index(fields=["published_user", "status", "-created", "-id"], name="project_user_status_created"),
+        ]
 
     def __str__(self):
         if self.published_user:
             return str(_(f"{self.published_user}'s Project ({self.title})"))
         return str(_(f"{self.published_username} Project ({self.title})"))
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "modified_date" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "modified_date"]
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.min_price > self.max_price:
             raise ValidationError(_("Minimum price cannot be greater than maximum price."))
@@ -93,6 +106,10 @@ class ProjectProposal(models.Model):
         unique_together = ["project", "proposer"]
         verbose_name = _("Project Proposal")
         verbose_name_plural = _("Project Proposals")
+        indexes = [
+            models.Index(fields=["proposer", "-proposal_date", "-id"], name="proposal_proposer_date"),
+            models.Index(fields=["project", "-proposal_date", "-id"], name="proposal_project_date"),
+        ]
 
     def __str__(self):
         # if self.project and self.proposer:
@@ -142,6 +159,9 @@ class ChosenProposal(models.Model):
         unique_together = ["project", "selected_proposal"]
         verbose_name = _("Chosen Proposal")
         verbose_name_plural = _("Chosen Proposals")
+        indexes = [
+            models.Index(fields=["-chosen_date", "-id"], name="chosen_proposal_date"),
+        ]
 
     def clean(self):
         if self.project != self.selected_proposal.project:
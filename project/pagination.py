@@ -1,5 +1,90 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ProjectPagination(pagination.PageNumberPagination):
+    """
+    Page numbers, or keyset pages when the request passes ``cursor`` (empty for the first page) or PROJECT_PAGINATION
+    is "cursor" and the request does not ask for a ``page``.
+
+    Keyset pages continue after the (ordering field, id) of the last row of the previous page, so a page costs one
+    LIMIT query on the composite indexes of the models whatever its depth and nothing is counted. They are only used
+    for the keyset_fields orderings, other orderings (e.g. search relevance) keep page numbers.
+    """
     page_size = 10
+    cursor_query_param = "cursor"
+    keyset_fields = ["created", "proposal_date", "chosen_date"]
+    invalid_cursor_message = _("Invalid cursor.")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = None
+        if self.use_cursor(request):
+            self.ordering = self.get_keyset_ordering(queryset)
+        if self.ordering is None:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def use_cursor(self, request):
+        if self.cursor_query_param in request.query_params:
+            return True
+        return settings.PROJECT_PAGINATION == "cursor" and self.page_query_param not in request.query_params
+
+    def get_keyset_ordering(self, queryset):
+        order_by = getattr(getattr(queryset, "query", None), "order_by", ())
+        if not order_by or not isinstance(order_by[0], str) or order_by[0].lstrip("-") not in self.keyset_fields:
+            return None
+        return order_by[0]
+
+    def paginate_keyset(self, queryset, request):
+        field = self.ordering.lstrip("-")
+        descending = self.ordering.startswith("-")
+        queryset = queryset.order_by(self.ordering, "-id" if descending else "id")
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            lookup = "lt" if descending else "gt"
+            queryset = queryset.filter(Q(**{f"{field}__{lookup}": value}) | Q(**{field: value, f"id__{lookup}": pk}))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.request = request
+        self.next_cursor = None
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            self.next_cursor = self.encode_cursor(getattr(last, field), last.pk)
+        return rows[:page_size]
+
+    @staticmethod
+    def encode_cursor(value, pk):
+        return base64.urlsafe_b64encode(json.dumps([value.isoformat(), pk]).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(value), int(pk)
+        except (ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if self.ordering is None:
+            return super().get_paginated_response(data)
+        return Response({
+            "next": self.get_next_cursor_link(),
+            "results": data,
+        })
+
@@ -0,0 +1,181 @@
+import heapq
+import statistics
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+
+from project.cache import FEED_VERSION_KEY, bump_version, get_version
+from project.models import Project, ProjectProposal
+from user_resume.models import UserSkill
+
+USER_VERSION_KEY = "project_recommendations:user:%s"
+RESULTS_KEY = "project_recommendations:%s:%s:%s"
+DELETED_COUNT_KEY = "project_recommendations:deleted"
+DELETED_KEY = "project_recommendations:deleted:%s"
+
+PROJECT_FIELDS = ["id", "status", "published_user_id", "min_price", "max_price", "created", "modified_date"]
+
+IndexedProject = namedtuple("IndexedProject", ["owner_id", "min_price", "max_price", "created", "skill_ids"])
+
+
+class ProjectIndex:
+    """
+    In-process inverted index of the active projects: the ids of the projects needing each skill, and the few fields
+    of every project used for scoring.
+
+    It is built from the database on first use, then brought up to date by re-reading only the projects whose
+    modified_date moved since the last sync (less RECOMMENDATION_SYNC_OVERLAP, a transaction committing late saves an
+    earlier modified_date), dropping the projects deleted since from the numbered log of deletions in the cache (see
+    forget_deleted_project), and rebuilt every RECOMMENDATION_REBUILD_INTERVAL seconds. It syncs at most every
+    RECOMMENDATION_SYNC_INTERVAL seconds, and right away when the feed version of project.cache (bumped by every change
+    of a project, whichever process made it) moved since the last sync.
+    """
+
+    def __init__(self):
+        self.projects = {}
+        self.skill_projects = {}
+        self.synced_until = None
+        self.checked_at = 0.0
+        self.built_at = 0.0
+        self.feed_version = None
+        self.deleted_count = 0
+        self.lock = threading.Lock()
+
+    def sync(self, feed_version=None):
+        with self.lock:
+            now = time.monotonic()
+            if feed_version == self.feed_version and now - self.checked_at < settings.RECOMMENDATION_SYNC_INTERVAL:
+                return
+            self.checked_at = now
+            self.feed_version = feed_version
+            # Read first, a project deleted while the index is read is removed again at the next sync.
+            deleted_count = cache.get(DELETED_COUNT_KEY, 0)
+            rebuild = now - self.built_at > settings.RECOMMENDATION_REBUILD_INTERVAL
+            # The log restarted (evicted from the cache), deletions may have been missed.
+            if self.synced_until is None or rebuild or deleted_count < self.deleted_count:
+                self.build()
+                self.built_at = now
+            else:
+                overlap = timedelta(seconds=settings.RECOMMENDATION_SYNC_OVERLAP)
+                self.update(Project.objects.filter(modified_date__gte=self.synced_until - overlap))
+                if deleted_count > self.deleted_count:
+                    keys = [DELETED_KEY % number for number in range(self.deleted_count + 1, deleted_count + 1)]
+                    for project_id in cache.get_many(keys).values():
+                        self.remove(project_id)
+            self.deleted_count = deleted_count
+
+    def build(self):
+        self.projects, self.skill_projects = {}, {}
+        projects = Project.objects.filter(status="active").values_list(*PROJECT_FIELDS)
+        skills = Project.skill_needed.through.objects.filter(project__status="active")
+        self.load(projects, skills)
+
+    def update(self, projects):
+        projects = list(projects.values_list(*PROJECT_FIELDS))
+        if not projects:
+            return
+        for project in projects:
+            self.remove(project[0])
+        active = [project for project in projects if project[1] == "active"]
+        skills = Project.skill_needed.through.objects.filter(project_id__in=[project[0] for project in active])
+        self.load(active, skills)
+        self.synced_until = max(self.synced_until, *(project[-1] for project in projects))
+
+    def load(self, projects, skills):
+        project_skills = {}
+        for project_id, skill_id in skills.values_list("project_id", "skill_id"):
+            project_skills.setdefault(project_id, []).append(skill_id)
+        for project_id, _, owner_id, min_price, max_price, created, modified_date in projects:
+            skill_ids = frozenset(project_skills.get(project_id, ()))
+            self.projects[project_id] = IndexedProject(owner_id, min_price, max_price, created.timestamp(), skill_ids)
+            for skill_id in skill_ids:
+                self.skill_projects.setdefault(skill_id, set()).add(project_id)
+            if self.synced_until is None or modified_date > self.synced_until:
+                self.synced_until = modified_date
+
+    def remove(self, project_id):
+        project = self.projects.pop(project_id, None)
+        if project is not None:
+            for skill_id in project.skill_ids:
+                self.skill_projects[skill_id].discard(project_id)
+
+    def score(self, skill_ids, user_id, excluded, target_price, limit):
+        """The limit best (score, project id) for a freelancer with skill_ids, best first."""
+        weights = settings.RECOMMENDATION_WEIGHTS
+        half_life = settings.RECOMMENDATION_RECENCY_HALF_LIFE
+        now = time.time()
+        with self.lock:
+            # Counting over the posting lists of the user's skills runs in C, only projects sharing a skill are scored.
+            overlap = Counter(chain.from_iterable(self.skill_projects.get(skill_id, ()) for skill_id in skill_ids))
+            scored = []
+            for project_id, matched in overlap.items():
+                project = self.projects[project_id]
+                if project.owner_id == user_id or project_id in excluded:
+                    continue
+                if target_price is None or project.min_price <= target_price <= project.max_price:
+                    price_fit = 1.0
+                else:
+                    distance = min(abs(target_price - project.min_price), abs(target_price - project.max_price))
+                    price_fit = max(0.0, 1 - distance / target_price)
+                scored.append((
+                    weights["skills"] * matched / len(project.skill_ids)
+                    + weights["price"] * price_fit
+                    + weights["recency"] * 0.5 ** ((now - project.created) / half_life),
+                    project_id,
+                ))
+        return heapq.nlargest(limit, scored)
+
+
+project_index = ProjectIndex()
+
+
+def forget_deleted_project(project_id):
+    """
+    Logs the deletion of a project for the indexes of every process, called once the deletion is committed and before
+    the feed version is bumped. Entries outlive RECOMMENDATION_REBUILD_INTERVAL, every index rebuilt since then
+    read the database without the project.
+    """
+    try:
+        number = cache.incr(DELETED_COUNT_KEY)
+    except ValueError:
+        cache.add(DELETED_COUNT_KEY, 0, None)
+        number = cache.incr(DELETED_COUNT_KEY)
+    cache.set(DELETED_KEY % number, project_id, 2 * settings.RECOMMENDATION_REBUILD_INTERVAL)
+
+
+def invalidate_user(user_id):
+    """Forgets the cached recommendations of a user, after their skills or proposals changed."""
+    bump_version(USER_VERSION_KEY % user_id)
+
+
+def recommend(user, limit=None):
+    """
+    Ids of the active projects recommended to user, best first, scored on the share of the project's skills the user
+    has, the fit of the project's price range with the prices the user proposed before and the project's age.
+
+    Results are cached per user until their skills or proposals change or a project does.
+    """
+    # The cache is shared by the processes, the key only holds versions from it. The feed version is read before the
+    # sync, the index then has every change of the projects made before that version.
+    feed_version = get_version(FEED_VERSION_KEY)
+    project_index.sync(feed_version)
+    limit = limit or settings.RECOMMENDATION_LIMIT
+    key = RESULTS_KEY % (user.pk, cache.get(USER_VERSION_KEY % user.pk, 0), feed_version)
+    project_ids = cache.get(key)
+    if project_ids is not None:
+        return project_ids[:limit]
+
+    skill_ids = list(UserSkill.skills.through.objects.filter(userskill__user=user).values_list("skill_id", flat=True))
+    proposals = list(ProjectProposal.objects.filter(proposer=user).values_list("project_id", "proposed_price"))
+    target_price = statistics.median(price for _, price in proposals) if proposals else None
+    excluded = {project_id for project_id, _ in proposals}
+
+    scored = project_index.score(skill_ids, user.pk, excluded, target_price, settings.RECOMMENDATION_LIMIT)
+    project_ids = [project_id for _, project_id in scored]
+    cache.set(key, project_ids, settings.RECOMMENDATION_CACHE_TTL)
+    return project_ids[:limit]
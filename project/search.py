@@ -0,0 +1,100 @@
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+
+from djangofls.search import fts5_match
+from project.models import Project
+
+
+class ProjectSearchBackend:
+    """
+    Full-text index over the title, description, additional notes and skill names of the projects.
+
+    The index is updated by project.signals whenever a project or its skills change. filter() restricts a project
+    queryset to the matches of a query and annotates it with search_rank, lower is a better match. Every term must
+    match, the last one as a prefix so results show up while the user is typing.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, projects):
+        raise NotImplementedError
+
+    def remove(self, project_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def filter(self, queryset, terms):
+        raise NotImplementedError
+
+    @staticmethod
+    def skill_names(project_ids):
+        names = {project_id: [] for project_id in project_ids}
+        for project_id, name in (Project.skill_needed.through.objects.filter(project_id__in=project_ids)
+                                 .values_list("project_id", "skill__name")):
+            names[project_id].append(name)
+        return names
+
+
+class SQLiteProjectSearch(ProjectSearchBackend):
+    """Uses the project_project_fts FTS5 table created by migration 0067, its rowid is the project id."""
+
+    # bm25() weights of the title, description, additional_notes and skills columns.
+    weights = (10.0, 1.0, 1.0, 5.0)
+
+    def index(self, projects):
+        projects = list(projects)
+        if not projects:
+            return
+        skills = self.skill_names([project.pk for project in projects])
+        with self.connection.cursor() as cursor:
+            cursor.executemany("DELETE FROM project_project_fts WHERE rowid = %s",
+                               [(project.pk,) for project in projects])
+            cursor.executemany(
+                "INSERT INTO project_project_fts(rowid, title, description, additional_notes, skills) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [(project.pk, project.title, project.description, project.additional_notes,
+                  " ".join(skills[project.pk])) for project in projects],
+            )
+
+    def remove(self, project_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany("DELETE FROM project_project_fts WHERE rowid = %s",
+                               [(project_id,) for project_id in project_ids])
+
+    def rebuild(self, batch_size=1000):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM project_project_fts")
+        projects = Project.objects.only("id", "title", "description", "additional_notes").order_by("id")
+        last_id = 0
+        while True:
+            batch = list(projects.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            self.index(batch)
+            last_id = batch[-1].id
+
+    def filter(self, queryset, terms):
+        # The matches are selected once by the IN subquery, each of them is then ranked by a lookup of its rowid.
+        match = fts5_match(terms)
+        return queryset.filter(
+            id__in=RawSQL("SELECT rowid FROM project_project_fts WHERE project_project_fts MATCH %s", [match]),
+        ).annotate(search_rank=RawSQL(
+            "SELECT bm25(project_project_fts, %s, %s, %s, %s) FROM project_project_fts "
+            "WHERE project_project_fts MATCH %s AND rowid = project_project.id",
+            [*self.weights, match],
+        ))
+
+
+BACKENDS = {
+    "sqlite": SQLiteProjectSearch,
+}
+
+
+def get_project_search_backend():
+    """The index of the database holding the projects, None if its vendor has none."""
+    connection = connections[router.db_for_read(Project)]
+    backend = BACKENDS.get(connection.vendor)
+    return backend(connection) if backend else None
@@ -1,4 +1,5 @@
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Prefetch
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -8,7 +9,8 @@ from rest_framework.reverse import reverse
 from education.serializers import SkillSerializer
 from payment.models import Bid, TransactionLog
 from project.models import Project, ProjectFile, ProjectProposal, ChosenProposal, Dispute
-from user_resume.models import UserReview, UserPortfolio, UserEducation, UserSkill, UserExperience
+from user.models import User
+from user_resume.models import UserReview
 
 
 class ProjectFileSerializer(serializers.ModelSerializer):
@@ -29,6 +31,13 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = ("published_username",)
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=""):
+        # published_user, the skills and the files of a page of projects (reached through prefix) in three queries.
+        return queryset.select_related(f"{prefix}published_user").prefetch_related(
+            f"{prefix}skill_needed", f"{prefix}project_files"
+        )
+
     def create(self, validated_data):
         uploaded_files_data = validated_data.pop("files", [])
         skills_data = validated_data.pop("skill_needed", [])
@@ -148,27 +157,36 @@ class ProjectProposalSerializer(ProjectProposalCreateSerializer):
     proposer_experiences = serializers.SerializerMethodField()
     proposer_portfolio = serializers.SerializerMethodField()
 
-    def get_model_links(self, i, model, url_name):
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # The resume links of every proposer of the page are read from the prefetched relations.
+        return queryset.prefetch_related(
+            Prefetch("proposer", queryset=User.objects.select_related("userskill")),
+            "proposer__user_educations", "proposer__user_experience", "proposer__user_portfolio",
+        )
+
+    def get_model_links(self, instances, url_name):
         request = self.context.get("request")
         link = []
-        for instance in model.objects.filter(user=i.proposer):
+        for instance in instances:
             link.append(reverse(url_name, kwargs={"pk": instance.id}, request=request))
         return link
 
     def get_proposer_profile(self, i):
-        return reverse("user-profile-detail", kwargs={"pk": i.proposer.pk}, request=self.context.get("request"))
+        return reverse("user-profile-detail", kwargs={"pk": i.proposer_id}, request=self.context.get("request"))
 
     def get_proposer_educations(self, i):
-        return self.get_model_links(i, UserEducation, "user-educations-detail")
+        return self.get_model_links(i.proposer.user_educations.all(), "user-educations-detail")
 
     def get_proposer_skills(self, i):
-        return self.get_model_links(i, UserSkill, "user-skills-detail")
+        user_skill = getattr(i.proposer, "userskill", None)
+        return self.get_model_links([user_skill] if user_skill else [], "user-skills-detail")
 
     def get_proposer_experiences(self, i):
-        return self.get_model_links(i, UserExperience, "user-experience-detail")
+        return self.get_model_links(i.proposer.user_experience.all(), "user-experience-detail")
 
     def get_proposer_portfolio(self, i):
-        return self.get_model_links(i, UserPortfolio, "user-portfolio-detail")
+        return self.get_model_links(i.proposer.user_portfolio.all(), "user-portfolio-detail")
 
 
 class ProjectProposalDetailSerializer(serializers.ModelSerializer):
@@ -181,6 +199,11 @@ class ProjectProposalDetailSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = ("proposer_username", "is_accepted", "is_canceled")
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # project is shown through Project.__str__, which reads its published_user.
+        return queryset.select_related("proposer", "project__published_user")
+
     def validate(self, data):
         submission_date = data.get("submission_date")
         if submission_date and submission_date < timezone.now().date():
@@ -199,6 +222,10 @@ class ProjectProposalDetailSerializer(serializers.ModelSerializer):
 class UserProjectProposalDetailSerializer(ProjectProposalDetailSerializer):
     project = ProjectSerializer(read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return ProjectSerializer.setup_eager_loading(queryset.select_related("proposer"), prefix="project__")
+
 
 class InProgressProposalDetailSerializer(UserProjectProposalDetailSerializer):
     open_dispute = serializers.SerializerMethodField()
@@ -221,6 +248,11 @@ class ChosenProposalSerializer(serializers.ModelSerializer):
         model = ChosenProposal
         fields = "__all__"
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return ProjectSerializer.setup_eager_loading(queryset.select_related("selected_proposal__proposer"),
+                                                     prefix="selected_proposal__project__")
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data.get("selected_proposal", {}).pop("proposal_url", None)
@@ -233,11 +265,11 @@ class UserProjectInProgressSerializer(ChosenProposalSerializer):
 
     def get_mark_complete(self, obj):
         request = self.context.get("request")
-        return reverse("user-projects-complete", kwargs={"pk": obj.project.pk}, request=request)
+        return reverse("user-projects-complete", kwargs={"pk": obj.project_id}, request=request)
 
     def get_open_dispute(self, obj):
         request = self.context.get("request")
-        return reverse("user-projects-dispute", kwargs={"pk": obj.project.pk}, request=request)
+        return reverse("user-projects-dispute", kwargs={"pk": obj.project_id}, request=request)
 
 
 class OpenDispute(serializers.ModelSerializer):
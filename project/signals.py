@@ -1,13 +1,18 @@
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 
 from chat.models import ChatRoom
+from education.models import Skill
 from payment.models import Point, TransactionLog
-from project.models import ChosenProposal, Project, ProjectProposal, Dispute
+from project.cache import invalidate_projects
+from project.models import ChosenProposal, Project, ProjectFile, ProjectProposal, Dispute
+from project.recommendations import forget_deleted_project, invalidate_user
+from project.search import get_project_search_backend
 from user.models import User
-from user_resume.models import UserReview
+from user_resume.models import UserReview, UserSkill
 
 
 @receiver(post_save, sender=ChosenProposal)
@@ -148,3 +153,119 @@ def close_chatroom_on_project_delete_or_delete_if_no_messages(sender, instance,
             elif chat_room.status != "closed":
                 chat_room.status = "closed"
                 chat_room.save(update_fields=["status"])
+
+
+# Full-text index of the projects, see project.search.
+@receiver(post_save, sender=Project)
+def index_project(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {"title", "description", "additional_notes"} & set(update_fields):
+        return
+    backend = get_project_search_backend()
+    if backend is not None:
+        backend.index([instance])
+
+
+@receiver(post_delete, sender=Project)
+def unindex_project(sender, instance, **kwargs):
+    backend = get_project_search_backend()
+    if backend is not None:
+        backend.remove([instance.pk])
+
+
+@receiver(m2m_changed, sender=Project.skill_needed.through)
+def index_project_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    backend = get_project_search_backend()
+    if backend is None:
+        return
+    if not reverse:
+        if action in ["post_add", "post_remove", "post_clear"]:
+            backend.index([instance])
+    elif action == "pre_clear":
+        instance._cleared_project_ids = list(instance.project_needed.values_list("id", flat=True))
+    elif action in ["post_add", "post_remove", "post_clear"]:
+        project_ids = pk_set if action != "post_clear" else getattr(instance, "_cleared_project_ids", [])
+        backend.index(Project.objects.filter(pk__in=project_ids))
+
+
+@receiver(post_save, sender=Skill)
+def index_renamed_skill(sender, instance, created, **kwargs):
+    backend = get_project_search_backend()
+    if backend is not None and not created:
+        backend.index(instance.project_needed.all())
+
+
+# Recommendations (see project.recommendations) and cached responses (see project.cache).
+@receiver(m2m_changed, sender=Project.skill_needed.through)
+def touch_project_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action not in ["post_add", "post_remove", "post_clear"]:
+            return
+        project_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._touched_project_ids = list(instance.project_needed.values_list("id", flat=True))
+        return
+    elif action in ["post_add", "post_remove", "post_clear"]:
+        project_ids = pk_set if action != "post_clear" else getattr(instance, "_touched_project_ids", [])
+    else:
+        return
+    Project.objects.filter(pk__in=project_ids).update(modified_date=timezone.now())
+    invalidate_projects_on_commit(project_ids)
+
+
+@receiver(m2m_changed, sender=UserSkill.skills.through)
+def invalidate_user_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if not reverse:
+        invalidate_user(instance.user_id)
+    else:
+        user_ids = UserSkill.objects.filter(pk__in=pk_set).values_list("user_id", flat=True) if pk_set else []
+        for user_id in user_ids:
+            invalidate_user(user_id)
+
+
+@receiver(post_save, sender=ProjectProposal)
+def invalidate_proposer(sender, instance, created, **kwargs):
+    if created and instance.proposer_id:
+        invalidate_user(instance.proposer_id)
+
+
+def invalidate_projects_on_commit(project_ids):
+    # After the commit, a response cached in between would otherwise keep the old data under the new version.
+    project_ids = list(project_ids)
+    transaction.on_commit(lambda: invalidate_projects(project_ids))
+
+
+@receiver(post_save, sender=Project)
+def invalidate_project(sender, instance, **kwargs):
+    invalidate_projects_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Project)
+def invalidate_deleted_project(sender, instance, **kwargs):
+    project_id = instance.pk
+
+    def invalidate():
+        # Logged before the feed version is bumped, a process seeing the new version also sees the deletion.
+        forget_deleted_project(project_id)
+        invalidate_projects([project_id])
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_published_projects(sender, instance, **kwargs):
+    # published_user is set to NULL by an UPDATE without signals, the projects are listed before the user is deleted.
+    invalidate_projects_on_commit(instance.user_projects.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=ProjectFile)
+@receiver(post_delete, sender=ProjectFile)
+def invalidate_project_files(sender, instance, **kwargs):
+    invalidate_projects_on_commit([instance.project_id])
+
+
+@receiver(post_save, sender=Skill)
+def invalidate_renamed_skill(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_projects_on_commit(instance.project_needed.values_list("id", flat=True))
@@ -0,0 +1,223 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from djangofls.search import search_terms
+from project.cache import FEED_VERSION_KEY, PROJECT_VERSION_KEY, get_version
+from education.models import Skill
+from project.models import ChosenProposal, Project, ProjectFile, ProjectProposal
+from project.recommendations import ProjectIndex, recommend
+from project.search import get_project_search_backend
+from user.models import User
+from user_resume.models import UserSkill
+
+
+# Tests clear the cache, never the one configured for the project (a shared Redis in docker-compose).
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def create_user(username):
+    return User.objects.create_user("Test", "User", username, f"{username}@example.com", "password", is_active=True)
+
+
+def create_project(owner, title, description="Description", skills=(), **fields):
+    project = Project.objects.create(published_user=owner, title=title, description=description, min_price=100,
+                                     max_price=200, due_date=date.today() + timedelta(days=30),
+                                     proposal_time_end=date.today() + timedelta(days=10), **fields)
+    project.skill_needed.add(*[Skill.objects.get_or_create(name=name)[0] for name in skills])
+    return project
+
+
+class ProjectSearchTests(TestCase):
+    def setUp(self):
+        self.owner = create_user("owner")
+
+    def search(self, query):
+        queryset = get_project_search_backend().filter(Project.objects.all(), search_terms(query))
+        return list(queryset.order_by("search_rank", "id").values_list("title", flat=True))
+
+    def test_titles_rank_before_descriptions(self):
+        create_project(self.owner, "Online shop", description="Built with django")
+        create_project(self.owner, "Django dashboard")
+        create_project(self.owner, "Mobile game")
+        self.assertEqual(self.search("django"), ["Django dashboard", "Online shop"])
+
+    def test_every_term_matches_and_the_last_one_as_a_prefix(self):
+        create_project(self.owner, "Data pipeline", skills=["Python"])
+        create_project(self.owner, "Data dashboard", skills=["JavaScript"])
+        self.assertEqual(self.search("data pyth"), ["Data pipeline"])
+
+    def test_fts5_syntax_in_the_query_is_ignored(self):
+        create_project(self.owner, "Logo design")
+        self.assertEqual(self.search('logo" (desi*'), ["Logo design"])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProjectCacheTests(TestCase):
+    databases = {"default", "chat"}
+
+    def setUp(self):
+        cache.clear()
+        self.owner = create_user("owner")
+
+    def test_deleting_the_owner_invalidates_their_projects(self):
+        project = create_project(self.owner, "Expired project", status="expired")
+        version = get_version(PROJECT_VERSION_KEY % project.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.delete()
+        self.assertNotEqual(get_version(PROJECT_VERSION_KEY % project.pk), version)
+
+    def test_the_feed_pages_leave_out_the_users_own_projects(self):
+        viewer = create_user("viewer")
+        own = {create_project(viewer, f"Own {i}").pk for i in range(3)}
+        for i in range(12):
+            create_project(self.owner, f"Project {i}")
+        client = APIClient()
+        client.force_authenticate(viewer)
+
+        first = client.get("/project/", {"page": 1}).data
+        self.assertEqual(first["count"], 12)
+        self.assertEqual(len(first["results"]), 10)
+        second = client.get(first["next"]).data
+        self.assertEqual(len(second["results"]), 2)
+        self.assertIsNone(second["next"])
+        self.assertFalse(own & {project["id"] for project in first["results"] + second["results"]})
+
+        # The pages cached for the viewer are not served to other users.
+        client.force_authenticate(self.owner)
+        response = client.get("/project/", {"page": 1})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["count"], 3)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_user("owner")
+        self.freelancer = create_user("freelancer")
+        UserSkill.objects.create(user=self.freelancer).skills.add(Skill.objects.create(name="Python"))
+        self.enterContext(patch("project.recommendations.project_index", ProjectIndex()))
+
+    def test_projects_changed_by_another_process_are_recommended_right_away(self):
+        first = create_project(self.owner, "First", skills=["Python"])
+        self.assertEqual(recommend(self.freelancer), [first.pk])
+
+        # Within the sync interval of this process's index, the change is seen through the feed version of the cache.
+        with self.captureOnCommitCallbacks(execute=True):
+            second = create_project(self.owner, "Second", skills=["Python"])
+        self.assertEqual(sorted(recommend(self.freelancer)), [first.pk, second.pk])
+
+    def test_projects_committed_after_the_sync_with_an_earlier_modified_date_are_synced(self):
+        first = create_project(self.owner, "First", skills=["Python"])
+        self.assertEqual(recommend(self.freelancer), [first.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = create_project(self.owner, "Second", skills=["Python"])
+        # Saved before the first project but committed after the index read it.
+        Project.objects.filter(pk=second.pk).update(modified_date=first.modified_date - timedelta(seconds=10))
+        self.assertEqual(sorted(recommend(self.freelancer)), [first.pk, second.pk])
+
+    def test_deleted_projects_leave_the_index_of_every_process(self):
+        first = create_project(self.owner, "First", skills=["Python"])
+        second = create_project(self.owner, "Second", skills=["Python"])
+        other_process = ProjectIndex()
+        other_process.sync(get_version(FEED_VERSION_KEY))
+        self.assertEqual(set(other_process.projects), {first.pk, second.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        other_process.sync(get_version(FEED_VERSION_KEY))
+        self.assertEqual(set(other_process.projects), {first.pk})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProjectQueryCountTests(TestCase):
+    """The project and proposal endpoints run as many queries for one row as for a page of them."""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = create_user("owner")
+        self.client = APIClient()
+
+    def create_projects(self, count, status="active"):
+        projects = []
+        for i in range(count):
+            project = create_project(self.owner, f"Project {i}", skills=["Python", "Django"], status=status)
+            ProjectFile.objects.create(project=project, file=f"project_files/{project.pk}.pdf")
+            projects.append(project)
+        return projects
+
+    def propose(self, project, proposer=None):
+        proposer = proposer or create_user(f"proposer{ProjectProposal.objects.count()}")
+        UserSkill.objects.get_or_create(user=proposer)
+        return ProjectProposal.objects.create(project=project, proposer=proposer, proposal_text="Proposal",
+                                              proposed_price=150, submission_date=date.today() + timedelta(days=5))
+
+    def choose(self, proposal):
+        return ChosenProposal.objects.create(project=proposal.project, selected_proposal=proposal)
+
+    def get(self, user, url, rows, queries):
+        # Cached responses would hide the queries, see project.cache.
+        cache.clear()
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if rows is not None:
+            self.assertEqual(len(response.data["results"]), rows)
+
+    def test_project_list(self):
+        viewer = create_user("viewer")
+        self.create_projects(1)
+        self.get(viewer, "/project/", 1, 4)
+        self.create_projects(9)
+        self.get(viewer, "/project/", 10, 4)
+
+    def test_project_detail(self):
+        viewer = create_user("viewer")
+        project = self.create_projects(1)[0]
+        self.get(viewer, f"/project/{project.pk}/", None, 3)
+        project.skill_needed.add(*[Skill.objects.create(name=f"Skill {i}") for i in range(5)])
+        ProjectFile.objects.create(project=project, file="project_files/other.pdf")
+        self.get(viewer, f"/project/{project.pk}/", None, 3)
+
+    def test_expired_projects(self):
+        self.create_projects(1, status="expired")
+        self.get(self.owner, "/user-project/expired_project/", 1, 4)
+        self.create_projects(9, status="expired")
+        self.get(self.owner, "/user-project/expired_project/", 10, 4)
+
+    def test_in_progress_projects(self):
+        self.choose(self.propose(self.create_projects(1)[0]))
+        self.get(self.owner, "/user-project/in_progress_project/", 1, 4)
+        for project in self.create_projects(9):
+            self.choose(self.propose(project))
+        self.get(self.owner, "/user-project/in_progress_project/", 10, 4)
+
+    def test_proposals_of_a_project(self):
+        project = self.create_projects(1)[0]
+        self.propose(project)
+        self.get(self.owner, f"/user-project/{project.pk}/project_proposals/", 1, 9)
+        for _ in range(9):
+            self.propose(project)
+        self.get(self.owner, f"/user-project/{project.pk}/project_proposals/", 10, 9)
+
+    def test_proposals_of_a_proposer(self):
+        proposer = create_user("proposer")
+        self.propose(self.create_projects(1)[0], proposer)
+        self.get(proposer, "/user-proposal/", 1, 4)
+        for project in self.create_projects(9):
+            self.propose(project, proposer)
+        self.get(proposer, "/user-proposal/", 10, 4)
+
+    def test_in_progress_proposals_of_a_proposer(self):
+        proposer = create_user("proposer")
+        self.choose(self.propose(self.create_projects(1)[0], proposer))
+        self.get(proposer, "/user-proposal/in_progress/", 1, 4)
+        for project in self.create_projects(9):
+            self.choose(self.propose(project, proposer))
+        self.get(proposer, "/user-proposal/in_progress/", 10, 4)
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from project.views import ProjectViewSet, UserProjectFileDelete, UserProjectProposalViewSet, UserProjectViewSet, \
-    CompleteReviewViewSet
+    CompleteReviewViewSet, ProjectCacheMetricsView
 
 router = DefaultRouter()
 router.register("project", ProjectViewSet, basename="projects")
@@ -13,4 +13,5 @@ router.register("complete-review", CompleteReviewViewSet, basename="complete-rev
 urlpatterns = [
     path("", include(router.urls)),
     path("projectfile/<int:pk>/", UserProjectFileDelete.as_view(), name="proj-file-detail"),
+    path("project-cache-metrics/", ProjectCacheMetricsView.as_view(), name="project-cache-metrics"),
 ]
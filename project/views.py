@@ -7,12 +7,16 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
 from chat.models import ChatRoom
 from payment.models import Bid, Point, TransactionLog
+from project.cache import FEED_VERSION_KEY, PROJECT_VERSION_KEY, cached_response_data, hit_rates
+from project.filters import ProjectSearchFilter
 from project.models import Project, ProjectFile, ProjectProposal, ChosenProposal
 from project.pagination import ProjectPagination
+from project.recommendations import recommend
 
 from project.permissions import ProjectProposals, ProjectFileDelete, IsNotProjectOwnerOrHasNotProposed, IsProposalOwner, \
     IsProjectOwner, ProjectAndProposalModification, CanMarkProjectAsComplete, CanReview, DisputePermission
@@ -32,7 +36,7 @@ class ProjectViewSet(mixins.ListModelMixin,
     serializer_class = ProjectWithURLSerializer
     permission_classes = [permissions.IsAuthenticated]
     # filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, ProjectSearchFilter]
     filterset_fields = ["skill_needed"]
     search_fields = ["title", "skill_needed__name"]
     # ordering_fields = ["min_price", "max_price"]
@@ -44,6 +48,8 @@ class ProjectViewSet(mixins.ListModelMixin,
             queryset = Project.objects.filter(status="active").exclude(published_user=self.request.user)
             ordering = self.request.query_params.get("ordering", "-created")
             queryset = queryset.order_by(ordering)
+        if self.action in ["list", "retrieve"]:
+            queryset = ProjectWithURLSerializer.setup_eager_loading(queryset)
         return queryset
 
     def filter_queryset(self, queryset):
@@ -52,6 +58,18 @@ class ProjectViewSet(mixins.ListModelMixin,
             self.search_fields = []
         return super().filter_queryset(queryset)
 
+    def list(self, request, *args, **kwargs):
+        # Pages leave out the user's own projects, they are cached per user until any project changes.
+        data, hit = cached_response_data("list", FEED_VERSION_KEY, request,
+                                         lambda: super(ProjectViewSet, self).list(request, *args, **kwargs).data,
+                                         per_user=True)
+        return Response(data, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+    def retrieve(self, request, *args, **kwargs):
+        data, hit = cached_response_data("detail", PROJECT_VERSION_KEY % self.kwargs["pk"], request,
+                                         lambda: super(ProjectViewSet, self).retrieve(request, *args, **kwargs).data)
+        return Response(data, headers={"X-Cache": "HIT" if hit else "MISS"})
+
     def get_permissions(self):
         if self.action == "create_project_proposal":
             self.permission_classes = [IsNotProjectOwnerOrHasNotProposed]
@@ -72,7 +90,8 @@ class ProjectViewSet(mixins.ListModelMixin,
             project = self.get_object()
             project_proposals = ProjectProposal.objects.filter(project=project, proposer__isnull=False)
             ordering = self.request.query_params.get("ordering", "-proposal_date")
-            project_proposals = project_proposals.order_by(ordering)
+            project_proposals = ProjectProposalDetailSerializer.setup_eager_loading(
+                project_proposals.order_by(ordering))
             page = self.paginate_queryset(project_proposals)
             if page is not None:
                 serializer = self.get_serializer(page, many=True)
@@ -126,6 +145,20 @@ class ProjectViewSet(mixins.ListModelMixin,
                     return Response({"message": _("Project saved")}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=["get"])
+    def recommended(self, request):
+        project_ids = recommend(request.user)
+        projects = ProjectWithURLSerializer.setup_eager_loading(
+            Project.objects.filter(id__in=project_ids, status="active")).in_bulk()
+        projects = [projects[project_id] for project_id in project_ids if project_id in projects]
+        page = self.paginate_queryset(projects)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(projects, many=True)
+            return Response(serializer.data)
+
 
 class UserProjectViewSet(viewsets.ModelViewSet):
     serializer_class = UserProjectSerializer
@@ -149,6 +182,8 @@ class UserProjectViewSet(viewsets.ModelViewSet):
             queryset = queryset.order_by(ordering)
         elif self.action == "complete":
             queryset = queryset.filter(status="in_progress")
+        if self.action in ["list", "retrieve", "expired_project"]:
+            queryset = UserProjectSerializer.setup_eager_loading(queryset)
         return queryset
 
     def filter_queryset(self, queryset):
@@ -278,7 +313,7 @@ class UserProjectViewSet(viewsets.ModelViewSet):
             try:
                 project_proposals = ProjectProposal.objects.filter(project=project, proposer__isnull=False)
                 ordering = self.request.query_params.get("ordering", "-proposal_date")
-                project_proposals = project_proposals.order_by(ordering)
+                project_proposals = ProjectProposalSerializer.setup_eager_loading(project_proposals.order_by(ordering))
                 page = self.paginate_queryset(project_proposals)
                 if page is not None:
                     serializer = ProjectProposalSerializer(page, many=True, context={"request": request})
@@ -406,7 +441,7 @@ class UserProjectViewSet(viewsets.ModelViewSet):
         projects = self.filter_queryset(self.get_queryset().filter(status=status_filter))
         proposals = ChosenProposal.objects.filter(project__in=projects)
         ordering = self.request.query_params.get("ordering", "-chosen_date")
-        proposals = proposals.order_by(ordering)
+        proposals = ChosenProposalSerializer.setup_eager_loading(proposals.order_by(ordering))
         page = self.paginate_queryset(proposals)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -464,6 +499,8 @@ class UserProjectProposalViewSet(mixins.ListModelMixin,
         ordering = self.request.query_params.get("ordering", "-proposal_date")
         if self.action == "list":
             queryset = queryset.filter(project__status="active")
+        if self.action in ["list", "retrieve", "in_progress", "canceled", "completed", "expired"]:
+            queryset = UserProjectProposalDetailSerializer.setup_eager_loading(queryset)
         return queryset.order_by(ordering)
 
     def get_serializer_class(self):
@@ -546,3 +583,11 @@ class CompleteReviewViewSet(mixins.RetrieveModelMixin,
                                               transaction_type="BIDS_RECEIVED", amount=1,
                                               description=f"Received 1 bid upon completing the review for the '{review.project.title}' project.")
         return Response(serializer.data)
+
+
+class ProjectCacheMetricsView(APIView):
+    """Hits and misses of the cached project list and detail responses in the worker serving the request."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(hit_rates())
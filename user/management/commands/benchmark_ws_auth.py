@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from channels.auth import AuthMiddlewareStack
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from djangofls.jwt_middleware import JWTAuthMiddlewareStack, JWTAuthMiddleware, UserCache, user_cache
+from user.models import User
+
+
+class UncachedJWTAuthMiddleware(JWTAuthMiddleware):
+    """Resolves the user with one query per handshake, like the middleware did before the user cache."""
+
+    async def get_user(self, user_id):
+        snapshot = await UserCache.fetch(user_id)
+        return UserCache.build(snapshot)
+
+
+async def accept(scope, receive, send):
+    return scope["user"]
+
+
+class Command(BaseCommand):
+    help = "Measures websocket handshake authentication with and without the JWT user cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--handshakes", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=100)
+        parser.add_argument("--users", type=int, default=20, help="Number of distinct users reconnecting")
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(is_active=True).order_by("id")[:options["users"]])
+        if not users:
+            raise CommandError("No active users to authenticate.")
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+
+        for name, middleware in [
+            ("uncached", UncachedJWTAuthMiddleware(AuthMiddlewareStack(accept))),
+            ("cached", JWTAuthMiddlewareStack(accept)),
+        ]:
+            user_cache.clear()
+            user_cache.hits = user_cache.misses = 0
+            elapsed = asyncio.run(self.run(middleware, tokens, options["handshakes"], options["concurrency"]))
+            queries = options["handshakes"] if name == "uncached" else user_cache.misses
+            self.stdout.write(
+                f"{name:>9}: {options['handshakes']} handshakes in {elapsed:.3f}s "
+                f"({options['handshakes'] / elapsed:.0f}/s), {queries} user queries"
+            )
+
+    @staticmethod
+    async def run(middleware, tokens, handshakes, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def handshake(i):
+            scope = {
+                "type": "websocket",
+                "path": "/ws/benchmark/",
+                "query_string": f"token={tokens[i % len(tokens)]}".encode(),
+                "headers": [],
+            }
+            async with semaphore:
+                user = await middleware(scope, None, None)
+            assert user.is_authenticated
+
+        start = time.perf_counter()
+        await asyncio.gather(*(handshake(i) for i in range(handshakes)))
+        return time.perf_counter() - start
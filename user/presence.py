@@ -0,0 +1,99 @@
+import asyncio
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from user.models import User
+
+CACHE_KEY = "presence:%s"
+
+
+class PresenceRegistry:
+    """
+    Presence of the users connected to this worker.
+
+    Heartbeats only touch memory. Every PRESENCE_FLUSH_INTERVAL seconds the online users are mirrored to the cache
+    (expiring after PRESENCE_TTL) and User.is_online / User.last_logout are brought up to date with one UPDATE for
+    the users online here and one for the users that left since the last flush.
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.flushed_online = set()
+        self.flushed_at = 0
+        self.flush_task = None
+
+    def connect(self, user_id, channel_name):
+        self.connections.setdefault(user_id, {})[channel_name] = time.monotonic()
+        self.ensure_flushing()
+
+    def heartbeat(self, user_id, channel_name):
+        self.connect(user_id, channel_name)
+
+    def disconnect(self, user_id, channel_name):
+        channels = self.connections.get(user_id, {})
+        channels.pop(channel_name, None)
+        if not channels:
+            self.connections.pop(user_id, None)
+
+    def online_users(self):
+        expired_before = time.monotonic() - settings.PRESENCE_TTL
+        for user_id, channels in list(self.connections.items()):
+            for channel_name, last_seen in list(channels.items()):
+                if last_seen < expired_before:
+                    del channels[channel_name]
+            if not channels:
+                del self.connections[user_id]
+        return set(self.connections)
+
+    def ensure_flushing(self):
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_periodically())
+
+    async def flush_periodically(self):
+        while self.connections or self.flushed_online:
+            await asyncio.sleep(settings.PRESENCE_FLUSH_INTERVAL)
+            # Connections are only touched on the event loop, the thread doing the writes gets a snapshot.
+            await database_sync_to_async(self.flush)(self.online_users())
+
+    def flush(self, online):
+        now = time.time()
+        cache.set_many({CACHE_KEY % user_id: now for user_id in online}, timeout=settings.PRESENCE_TTL)
+
+        left = self.flushed_online - online
+        heartbeats = cache.get_many([CACHE_KEY % user_id for user_id in left])
+        # A heartbeat newer than our own last write comes from another worker the user is still connected to.
+        went_offline = {user_id for user_id in left if heartbeats.get(CACHE_KEY % user_id, 0) <= self.flushed_at}
+        cache.delete_many([CACHE_KEY % user_id for user_id in went_offline])
+
+        if online:
+            User.objects.filter(id__in=online, is_online=False).update(is_online=True)
+        if went_offline:
+            User.objects.filter(id__in=went_offline).update(is_online=False, last_logout=timezone.now())
+        self.flushed_online = online
+        self.flushed_at = now
+
+
+presence = PresenceRegistry()
+
+
+def get_presence(users):
+    last_seen = cache.get_many([CACHE_KEY % user["id"] for user in users])
+    presence_info = {}
+    for user in users:
+        heartbeat = last_seen.get(CACHE_KEY % user["id"])
+        if heartbeat is not None:
+            presence_info[user["username"]] = {
+                "is_online": True,
+                "last_seen": datetime.fromtimestamp(heartbeat, tz=dt_timezone.utc),
+            }
+        else:
+            presence_info[user["username"]] = {
+                "is_online": user["is_online"],
+                "last_seen": user["last_logout"],
+            }
+    return presence_info
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from user.views import UserViewSet, AccountVerificationView, EmailVerificationView, PasswordResetView, \
-    UserTwoFactorAuthentication
+    UserTwoFactorAuthentication, PresenceView
 from user.views import UserProfileViewSet
 
 router = DefaultRouter()
@@ -16,5 +16,6 @@ urlpatterns = [
     path("activate-account/<str:uidb64>/<str:token>/", AccountVerificationView.as_view(), name="user-verification"),
     path("verify-email/<str:uidb64>/<str:token>/", EmailVerificationView.as_view(), name="email-verification"),
     path("password-reset/<str:uidb64>/<str:token>/", PasswordResetView.as_view(), name="email-verification"),
+    path("presence/", PresenceView.as_view(), name="presence"),
 
 ]
@@ -21,6 +21,7 @@ from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
 from user.models import UserProfile
+from user.presence import get_presence
 from . import permissions
 from user.serializers import EmailChangeSerializer, UserCreateSerializer, ResendAccountActivationSerializer, \
     PasswordChangeSerializer, PasswordResetSerializer, PasswordResetConfirmSerializer, PasswordSerializer, \
@@ -248,6 +249,23 @@ class EmailVerificationView(APIView):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
+class PresenceView(APIView):
+    permission_classes = [drf_permissions.IsAuthenticated]
+    max_users = 100
+
+    def get(self, request):
+        usernames = [username for username in request.query_params.get("users", "").split(",") if username]
+        if not usernames:
+            return Response({"error": _("Provide a comma separated list of usernames in users.")},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(usernames) > self.max_users:
+            return Response({"error": _("At most {max_users} users can be requested at once.").format(
+                max_users=self.max_users)}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = User.objects.filter(username__in=usernames).values("id", "username", "is_online", "last_logout")
+        return Response(get_presence(list(users)), status=status.HTTP_200_OK)
+
+
 class PasswordResetView(GenericAPIView):
     serializer_class = PasswordSerializer
     permission_classes = [drf_permissions.AllowAny]